@@ -25,6 +25,23 @@ class StudioAdmin(admin.ModelAdmin):
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
     prepopulated_fields = {'url': ('name',)}
+    list_display = ('name', 'anime', 'hls_status')
+    list_filter = ('hls_status',)
+    readonly_fields = ('hls_status', 'hls_playlist', 'duration')
+
+
+@admin.register(AnimeListEntry)
+class AnimeListEntryAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'anime', 'status', 'favorite', 'updated_date')
+    list_filter = ('status', 'favorite')
+    raw_id_fields = ('profile', 'anime')
+
+
+@admin.register(ListImport)
+class ListImportAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'format', 'status', 'processed', 'matched', 'created_date')
+    list_filter = ('status', 'format')
+    raw_id_fields = ('profile',)
 
 
 admin.site.register(Profile)
@@ -0,0 +1,400 @@
+import hashlib
+import posixpath
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.views import View
+
+from .models import Anime, AnimeListEntry, Directors, Genre, Profile, Studio, Video
+from .page_cache import get_content_version, get_page_cache_key, get_page_etag
+from .pagination import CursorPaginator, InvalidCursor
+
+MAX_IDS = 100
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def media_url(name):
+    return settings.MEDIA_URL + name if name else None
+
+
+def positive_int(value):
+    value = int(value)
+    if not 0 < value < 2 ** 31:
+        raise ValueError(value)
+    return value
+
+
+def year_value(value):
+    value = int(value)
+    if not 1 <= value <= 9999:
+        raise ValueError(value)
+    return value
+
+
+def choice_of(field_name):
+    choices = dict(Anime._meta.get_field(field_name).choices)
+
+    def clean(value):
+        if value not in choices:
+            raise ValueError(value)
+        return value
+    return clean
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+class ApiView(View):
+    """Базовый JSON view: строки из values(), разреженные поля (?fields=) и ETag.
+
+    fields - имя поля в ответе -> выражение для values(); transforms - преобразование
+    значения; computed_fields - имя -> выражения, из которых метод compute_<имя>(row)
+    собирает значение; relation_fields - имя -> (through-модель, колонка) для списков
+    id связей M2M, догружаемых одним запросом на страницу; volatile_fields - поля,
+    которые меняются без смены версии контента: с ними ETag считается по телу ответа.
+    """
+    queryset = None
+    fields = {}
+    default_fields = ()
+    transforms = {}
+    computed_fields = {}
+    relation_fields = {}
+    volatile_fields = ()
+    # Ответ зависит только от каталога - ETag по версии контента без запроса к БД
+    version_etag = True
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def get_field_names(self):
+        available = list(self.fields) + list(self.computed_fields) + list(self.relation_fields)
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.default_fields or available)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ApiError('Неизвестные поля: {}'.format(', '.join(unknown)))
+        return names
+
+    def get_value_expressions(self, names, extra=()):
+        expressions = {'id', *extra}
+        for name in names:
+            if name in self.fields:
+                expressions.add(self.fields[name])
+            elif name in self.computed_fields:
+                expressions.update(self.computed_fields[name])
+        return sorted(expressions)
+
+    def serialize(self, rows, names):
+        results = []
+        for row in rows:
+            item = {}
+            for name in names:
+                if name in self.fields:
+                    value = row[self.fields[name]]
+                    transform = self.transforms.get(name)
+                    item[name] = transform(value) if transform else value
+                elif name in self.computed_fields:
+                    item[name] = getattr(self, f'compute_{name}')(row)
+            results.append(item)
+        self.add_relations(results, rows, names)
+        return results
+
+    def add_relations(self, results, rows, names):
+        pass
+
+    def get_data(self):
+        raise NotImplementedError
+
+    def uses_volatile_fields(self):
+        try:
+            names = self.get_field_names()
+        except ApiError:
+            return True
+        return any(name in self.volatile_fields for name in names)
+
+    def get_version_etag(self):
+        if not self.version_etag or self.uses_volatile_fields():
+            return None
+        return get_page_etag(get_page_cache_key(self.request, get_content_version()))
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_version_etag()
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        try:
+            response = json_response(self.get_data())
+        except ApiError as e:
+            return json_response({'error': str(e)}, status=e.status)
+        except Http404 as e:
+            return json_response({'error': str(e) or 'Не найдено'}, status=404)
+        if not etag:
+            etag = '"{}"'.format(hashlib.md5(response.content).hexdigest())
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        response['ETag'] = etag
+        response['Cache-Control'] = 'max-age=0, must-revalidate'
+        return response
+
+
+class ApiListView(ApiView):
+    ordering = ('pk',)
+    orderings = {}
+    default_limit = 24
+    max_limit = 100
+
+    def get_ordering(self):
+        name = self.request.GET.get('ordering')
+        if not name:
+            return self.ordering
+        if name not in self.orderings:
+            raise ApiError('Неизвестная сортировка: {}'.format(name))
+        return self.orderings[name]
+
+    def uses_volatile_fields(self):
+        if super().uses_volatile_fields():
+            return True
+        try:
+            ordering = self.get_ordering()
+        except ApiError:
+            return True
+        return any(item.lstrip('-') in self.volatile_fields for item in ordering)
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', self.default_limit))
+        except ValueError:
+            raise ApiError('limit должен быть числом')
+        return min(max(limit, 1), self.max_limit)
+
+    def get_ids(self):
+        value = self.request.GET.get('ids')
+        if value is None:
+            return None
+        try:
+            ids = [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise ApiError('ids должны быть числами')
+        if len(ids) > MAX_IDS:
+            raise ApiError(f'Не больше {MAX_IDS} ids за запрос')
+        return ids
+
+    def get_data(self):
+        names = self.get_field_names()
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = self.get_ids()
+        if ids is not None:
+            rows = list(queryset.filter(pk__in=ids).order_by().values(*self.get_value_expressions(names)))
+            positions = {pk: position for position, pk in enumerate(ids)}
+            rows.sort(key=lambda row: positions[row['id']])
+            return {'results': self.serialize(rows, names)}
+        ordering = self.get_ordering()
+        order_fields = [item.lstrip('-') for item in ordering if item.lstrip('-') != 'pk']
+        values = queryset.order_by(*ordering).values(*self.get_value_expressions(names, order_fields))
+        paginator = CursorPaginator(values, self.get_limit())
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise ApiError('Неверный курсор')
+        return {
+            'results': self.serialize(page.object_list, names),
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+
+class ApiDetailView(ApiView):
+    lookup_field = 'url'
+
+    def get_data(self):
+        names = self.get_field_names()
+        queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: self.kwargs['slug']})
+        row = queryset.values(*self.get_value_expressions(names)).first()
+        if row is None:
+            raise Http404
+        return self.serialize([row], names)[0]
+
+
+class AnimeFieldsMixin:
+    queryset = Anime.objects.all()
+    fields = {
+        'id': 'id',
+        'title': 'title',
+        'second_title': 'second_title',
+        'url': 'url',
+        'poster': 'poster',
+        'description': 'description',
+        'year': 'year',
+        'total_series': 'total_series',
+        'status': 'status',
+        'age_rating': 'age_rating',
+        'season': 'season',
+        'type': 'type',
+        'studio_id': 'studio_id',
+        'views_count': 'views_count',
+        'comments_count': 'comments_count',
+        'ratings_count': 'ratings_count',
+        'rating_score': 'rating_score',
+    }
+    transforms = {
+        'poster': media_url,
+        'year': lambda value: value.year,
+    }
+    relation_fields = {
+        'genre_ids': (Anime.genre.through, 'genre_id'),
+        'director_ids': (Anime.directors.through, 'directors_id'),
+    }
+    # Просмотры записываются пачками в фоне и не меняют версию контента
+    volatile_fields = ('views_count',)
+
+    def add_relations(self, results, rows, names):
+        ids = [item['id'] for item in rows]
+        for name, (through, column) in self.relation_fields.items():
+            if name not in names:
+                continue
+            related = {}
+            for anime_id, value in through.objects.filter(anime_id__in=ids).values_list('anime_id', column):
+                related.setdefault(anime_id, []).append(value)
+            for item, row in zip(results, rows):
+                item[name] = sorted(related.get(row['id'], []))
+
+
+class AnimeListApi(AnimeFieldsMixin, ApiListView):
+    default_fields = ('id', 'title', 'url', 'poster', 'year', 'type', 'views_count', 'comments_count', 'rating_score')
+    ordering = ('title',)
+    orderings = {
+        'title': ('title',),
+        'trending': ('-trending_score', '-views_count'),
+        'popular': ('-views_count', '-comments_count'),
+        'recent': ('-year',),
+        'rating': ('-rating_score',),
+    }
+    filters = {
+        'genre': ('genre', positive_int),
+        'director': ('directors', positive_int),
+        'studio': ('studio_id', positive_int),
+        'type': ('type', choice_of('type')),
+        'status': ('status', choice_of('status')),
+        'season': ('season', choice_of('season')),
+        'age_rating': ('age_rating', choice_of('age_rating')),
+        'year': ('year__year', year_value),
+    }
+
+    def filter_queryset(self, queryset):
+        for param, (lookup, clean) in self.filters.items():
+            value = self.request.GET.get(param)
+            if not value:
+                continue
+            try:
+                value = clean(value)
+            except ValueError:
+                raise ApiError('Неверное значение {}: {}'.format(param, value))
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+
+class AnimeDetailApi(AnimeFieldsMixin, ApiDetailView):
+    pass
+
+
+class GenreListApi(ApiListView):
+    queryset = Genre.objects.all()
+    fields = {'id': 'id', 'name': 'name', 'url': 'url'}
+    ordering = ('name',)
+    max_limit = 500
+    default_limit = 500
+
+
+class StudioListApi(GenreListApi):
+    queryset = Studio.objects.all()
+
+
+class DirectorsListApi(GenreListApi):
+    queryset = Directors.objects.all()
+
+
+class EpisodeListApi(ApiListView):
+    queryset = Video.objects.all()
+    fields = {
+        'id': 'id',
+        'name': 'name',
+        'url': 'url',
+        'thumb': 'thumb',
+        'hls_status': 'hls_status',
+        'duration': 'duration',
+    }
+    transforms = {
+        'thumb': media_url,
+    }
+    computed_fields = {
+        'stream_url': ('url', 'anime__url'),
+        'hls_url': ('url', 'anime__url', 'hls_status', 'hls_playlist'),
+    }
+    ordering = ('pk',)
+    max_limit = 500
+    default_limit = 100
+
+    def filter_queryset(self, queryset):
+        anime_id = Anime.objects.filter(url=self.kwargs['slug']).values_list('pk', flat=True).first()
+        if anime_id is None:
+            raise Http404
+        return queryset.filter(anime_id=anime_id)
+
+    def compute_stream_url(self, row):
+        return reverse('anime:anime_video_stream', kwargs={'slug': row['url'], 'series': row['anime__url']})
+
+    def compute_hls_url(self, row):
+        # Плейлист отдается через view с проверкой доступа, а не из MEDIA_URL
+        if row['hls_status'] != 'ready' or not row['hls_playlist']:
+            return None
+        return reverse('anime:anime_video_hls', kwargs={
+            'slug': row['url'], 'series': row['anime__url'], 'name': posixpath.basename(row['hls_playlist']),
+        })
+
+
+class ProfileListApi(ApiListView):
+    queryset = AnimeListEntry.objects.all()
+    fields = {
+        'anime_id': 'anime_id',
+        'title': 'anime__title',
+        'url': 'anime__url',
+        'poster': 'anime__poster',
+        'status': 'status',
+        'favorite': 'favorite',
+        'updated_date': 'updated_date',
+    }
+    transforms = {
+        'poster': media_url,
+    }
+    ordering = ('-updated_date',)
+    # Списки меняются без смены версии каталога - ETag считается по телу ответа
+    version_etag = False
+
+    def filter_queryset(self, queryset):
+        if not Profile.objects.filter(pk=self.kwargs['pk']).exists():
+            raise Http404
+        queryset = queryset.filter(profile_id=self.kwargs['pk'])
+        status = self.request.GET.get('status')
+        if status:
+            if status not in dict(AnimeListEntry.STATUS_CHOICES):
+                raise ApiError('Неизвестный статус: {}'.format(status))
+            queryset = queryset.filter(status=status)
+        if self.request.GET.get('favorite') in ('1', 'true'):
+            queryset = queryset.filter(favorite=True)
+        return queryset
@@ -0,0 +1,247 @@
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .ingest import CatalogIngestor
+from .models import Anime, AnimeListEntry, Comment, Ip, Profile, Rating, RatingStar
+from .trending import record_activity
+
+BENCH_PREFIX = 'bench'
+
+SIZES = {
+    'small': {'anime': 200, 'users': 100, 'comments': 2000, 'ratings': 2000, 'views': 5000, 'entries': 3000},
+    'medium': {'anime': 2000, 'users': 1000, 'comments': 20000, 'ratings': 20000, 'views': 50000, 'entries': 30000},
+    'large': {'anime': 20000, 'users': 10000, 'comments': 200000, 'ratings': 200000, 'views': 500000, 'entries': 300000},
+}
+
+GENRES = 20
+DIRECTORS = 200
+STUDIOS = 50
+STARS = (1, 2, 3, 4, 5)
+
+BENCH_POSTER = 'anime_poster/bench.jpg'
+
+# Документационный диапазон IPv6 - не пересекается с реальными адресами посетителей
+BENCH_IP_PREFIX = '2001:db8::'
+
+DEFAULT_BUDGETS = {
+    'anime_list': {'queries': 15, 'wall_ms': 300},
+    'anime_trending': {'queries': 10, 'wall_ms': 200},
+    'anime_popular': {'queries': 10, 'wall_ms': 200},
+    'anime_detail': {'queries': 20, 'wall_ms': 300},
+    'anime_comments': {'queries': 5, 'wall_ms': 100},
+    'search': {'queries': 10, 'wall_ms': 300},
+    'anime_filter': {'queries': 10, 'wall_ms': 300},
+    'profile_detail': {'queries': 10, 'wall_ms': 200},
+    'profile_favorite': {'queries': 10, 'wall_ms': 200},
+    'api_anime_list': {'queries': 5, 'wall_ms': 100},
+}
+
+
+def get_budgets():
+    # BENCHMARK_BUDGETS в настройках переопределяет бюджеты отдельных сценариев
+    return {**DEFAULT_BUDGETS, **getattr(settings, 'BENCHMARK_BUDGETS', {})}
+
+
+def bench_url(index):
+    return f'{BENCH_PREFIX}-{index}'
+
+
+def ensure_poster():
+    path = os.path.join(settings.MEDIA_ROOT, BENCH_POSTER)
+    if not os.path.exists(path):
+        from PIL import Image
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', (460, 650), (40, 40, 60)).save(path, 'JPEG')
+
+
+def flush_dataset():
+    with transaction.atomic():
+        Anime.objects.filter(url__startswith=f'{BENCH_PREFIX}-').delete()
+        User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').delete()
+        Ip.objects.filter(ip__startswith=BENCH_IP_PREFIX).delete()
+
+
+def anime_records(rng, count):
+    choices = {name: [value for value, label in Anime._meta.get_field(name).choices]
+               for name in ('status', 'age_rating', 'season', 'type')}
+    for index in range(count):
+        yield {
+            'url': bench_url(index),
+            'title': f'Bench anime {index}',
+            'second_title': f'Bench title {rng.randrange(count)}',
+            'poster': BENCH_POSTER,
+            'description': 'Benchmark dataset',
+            'year': rng.randint(1990, 2022),
+            'total_series': rng.randint(1, 48),
+            'status': rng.choice(choices['status']),
+            'age_rating': rng.choice(choices['age_rating']),
+            'season': rng.choice(choices['season']),
+            'type': rng.choice(choices['type']),
+            'studio': f'Bench studio {rng.randrange(STUDIOS)}',
+            'genres': [f'Bench genre {value}' for value in rng.sample(range(GENRES), 3)],
+            'directors': [f'Bench director {rng.randrange(DIRECTORS)}'],
+        }
+
+
+def unique_pairs(rng, count, left, right):
+    pairs = set()
+    limit = min(count, len(left) * len(right))
+    while len(pairs) < limit:
+        pairs.add((rng.choice(left), rng.choice(right)))
+    return sorted(pairs)
+
+
+def seed_dataset(size='small', seed=42, stdout=None):
+    """Детерминированно заполняет БД данными для бенчмарка: одинаковые size и seed дают одинаковый набор."""
+    spec = SIZES[size]
+    rng = random.Random(seed)
+    ensure_poster()
+    flush_dataset()
+    CatalogIngestor(batch_size=1000).ingest(anime_records(rng, spec['anime']))
+    anime_ids = list(Anime.objects.filter(url__startswith=f'{BENCH_PREFIX}-').order_by('pk').values_list('pk', flat=True))
+
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}_{index}', password='!') for index in range(spec['users'])
+        ], batch_size=1000)
+        user_ids = list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').order_by('pk').values_list('pk', flat=True))
+        Profile.objects.bulk_create([Profile(user_id=pk) for pk in user_ids], batch_size=1000)
+        profile_ids = list(Profile.objects.filter(user__username__startswith=f'{BENCH_PREFIX}_').\
+            order_by('pk').values_list('pk', flat=True))
+
+        Comment.objects.bulk_create([
+            Comment(author_id=rng.choice(user_ids), anime_id=rng.choice(anime_ids), text=f'Комментарий {index}')
+            for index in range(spec['comments'])
+        ], batch_size=1000)
+
+        for value in STARS:
+            if not RatingStar.objects.filter(value=value).exists():
+                RatingStar.objects.create(value=value)
+        stars = list(RatingStar.objects.filter(value__in=STARS).values_list('pk', flat=True))
+        Rating.objects.bulk_create([
+            Rating(profile_id=profile_id, anime_id=anime_id, star_id=rng.choice(stars))
+            for profile_id, anime_id in unique_pairs(rng, spec['ratings'], profile_ids, anime_ids)
+        ], batch_size=1000)
+
+        statuses = [value for value, label in AnimeListEntry.STATUS_CHOICES]
+        AnimeListEntry.objects.bulk_create([
+            AnimeListEntry(profile_id=profile_id, anime_id=anime_id,
+                           status=rng.choice(statuses), favorite=rng.random() < 0.1)
+            for profile_id, anime_id in unique_pairs(rng, spec['entries'], profile_ids, anime_ids)
+        ], batch_size=1000)
+
+        addresses = [f'{BENCH_IP_PREFIX}{index:x}' for index in range(max(spec['views'] // 10, 1))]
+        Ip.objects.bulk_create([Ip(ip=address) for address in addresses], batch_size=1000)
+        ip_ids = list(Ip.objects.filter(ip__in=addresses).values_list('pk', flat=True))
+        through = Anime.views.through
+        views = unique_pairs(rng, spec['views'], anime_ids, ip_ids)
+        through.objects.bulk_create([through(anime_id=anime_id, ip_id=ip_id) for anime_id, ip_id in views],
+                                    batch_size=1000)
+        record_activity(views=Counter(anime_id for anime_id, ip_id in views))
+
+    for command in ('rebuild_counters', 'rebuild_ratings', 'update_trending', 'build_similarity', 'build_recommendations'):
+        call_command(command, stdout=stdout)
+    return {'anime': len(anime_ids), 'users': len(user_ids), **{name: spec[name] for name in
+                                                                ('comments', 'ratings', 'views', 'entries')}}
+
+
+def get_scenarios():
+    """Сценарии: имя, url и нужен ли вход под пользователем из набора."""
+    anime = Anime.objects.filter(url__startswith=f'{BENCH_PREFIX}-').order_by('-comments_count').only('url').first()
+    profile = Profile.objects.filter(user__username__startswith=f'{BENCH_PREFIX}_').\
+        order_by('-pk').only('pk').first()
+    if anime is None or profile is None:
+        return [], None
+    scenarios = [
+        ('anime_list', reverse('anime:anime_list'), False),
+        ('anime_trending', reverse('anime:anime_trending'), False),
+        ('anime_popular', reverse('anime:anime_popular'), False),
+        ('anime_detail', reverse('anime:anime_detail', kwargs={'slug': anime.url}), False),
+        ('anime_comments', reverse('anime:anime_comments', kwargs={'slug': anime.url}), False),
+        ('search', reverse('anime:search') + '?q=Bench+anime', False),
+        ('anime_filter', reverse('anime:anime_filter') + '?' + urlencode({
+            name: Anime._meta.get_field(name).choices[0][0] for name in ('type', 'status')}), False),
+        ('profile_detail', reverse('anime:profile_detail', kwargs={'pk': profile.pk}), True),
+        ('profile_favorite', reverse('anime:favorite', kwargs={'pk': profile.pk}), True),
+        ('api_anime_list', reverse('anime:api_anime_list') + '?ordering=trending', False),
+    ]
+    return scenarios, profile
+
+
+def measure(client, url, repeat):
+    """Время и запросы меряются без tracemalloc, пик памяти - отдельным прогоном."""
+    client.get(url)
+    walls, sql_times, query_counts, status = [], [], [], None
+    for attempt in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            content = response.getvalue() if response.streaming else response.content
+            walls.append((time.perf_counter() - started) * 1000)
+        status = response.status_code
+        query_counts.append(len(queries))
+        sql_times.append(sum(float(query['time']) for query in queries.captured_queries) * 1000)
+    tracemalloc.start()
+    try:
+        response = client.get(url)
+        if response.streaming:
+            response.getvalue()
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return {
+        'url': url,
+        'status': status,
+        'bytes': len(content),
+        'queries': max(query_counts),
+        'sql_ms': round(statistics.median(sql_times), 2),
+        'wall_ms': round(statistics.median(walls), 2),
+        'wall_ms_max': round(max(walls), 2),
+        'peak_kb': round(peak_kb, 1),
+    }
+
+
+def check_budget(name, result, budgets):
+    budget = budgets.get(name, {})
+    failures = []
+    if result['status'] != 200:
+        failures.append(f'{name}: статус {result["status"]}')
+    for metric in ('queries', 'wall_ms', 'sql_ms', 'peak_kb'):
+        limit = budget.get(metric)
+        if limit is not None and result[metric] > limit:
+            failures.append(f'{name}: {metric}={result[metric]} > {limit}')
+    return failures
+
+
+def run_benchmarks(repeat=5, budgets=None, only=None, page_cache=False):
+    budgets = get_budgets() if budgets is None else budgets
+    report = {'results': {}, 'failures': []}
+    # Запросы считаются по основной базе - чтение с реплик отключено на время прогона
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], PAGE_CACHE_ENABLED=page_cache,
+                           DATABASE_REPLICAS=[]):
+        scenarios, profile = get_scenarios()
+        if not scenarios:
+            report['failures'].append('Нет данных: сначала выполните seed_benchmark')
+            return report
+        anonymous, authenticated = Client(), Client()
+        authenticated.force_login(profile.user)
+        for name, url, login in scenarios:
+            if only and name not in only:
+                continue
+            result = measure(authenticated if login else anonymous, url, repeat)
+            report['results'][name] = result
+            report['failures'].extend(check_budget(name, result, budgets))
+    return report
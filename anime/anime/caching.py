@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.cache import caches, InvalidCacheBackendError
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_local_caches = {}
+
+
+def select_cache(alias_setting, timeout_setting, local_timeout_setting, default_timeout=300, default_local_timeout=30):
+    try:
+        cache = caches[getattr(settings, alias_setting, 'default')]
+    except InvalidCacheBackendError:
+        cache = None
+    if cache is None or isinstance(cache, (LocMemCache, DummyCache)):
+        if alias_setting not in _local_caches:
+            _local_caches[alias_setting] = LocMemCache(f'anime-{alias_setting.lower()}', {})
+        return _local_caches[alias_setting], getattr(settings, local_timeout_setting, default_local_timeout)
+    return cache, getattr(settings, timeout_setting, default_timeout)
@@ -0,0 +1,120 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_pin'
+
+# Чтение с основной базы: после записи в этом запросе/задаче или в окне после записи пользователя
+_pinned = ContextVar('db_pinned', default=False)
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', ()) if alias in settings.DATABASES]
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+@contextmanager
+def use_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def check_replica(alias):
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG', 10)
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # NULL - реплика еще ничего не применила или это не реплика
+            cursor.execute('SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())')
+            lag = cursor.fetchone()[0]
+            if lag is not None and lag > max_lag:
+                logger.warning('Реплика %s отстает на %.1f с', alias, lag)
+                return False
+        else:
+            cursor.execute('SELECT 1')
+    return True
+
+
+def is_healthy(alias):
+    """Результат проверки кешируется на REPLICA_HEALTH_CHECK_INTERVAL секунд в процессе."""
+    now = time.monotonic()
+    state = _health.get(alias)
+    if state is not None and now < state[1]:
+        return state[0]
+    with _health_lock:
+        state = _health.get(alias)
+        if state is not None and now < state[1]:
+            return state[0]
+        try:
+            healthy = check_replica(alias)
+        except Exception:
+            logger.warning('Реплика %s недоступна, чтение идет с основной базы', alias, exc_info=True)
+            connections[alias].close()
+            healthy = False
+        _health[alias] = (healthy, now + getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 10))
+        return healthy
+
+
+def get_healthy_replicas():
+    return [alias for alias in get_replicas() if is_healthy(alias)]
+
+
+class ReplicaRouter:
+    """Чтение с реплик из DATABASE_REPLICAS, запись и миграции - на default.
+
+    После записи чтение до конца запроса идет с основной базы, а ReplicaPinningMiddleware
+    продлевает это на REPLICA_PIN_SECONDS для следующих запросов пользователя.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = get_healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replicas()
+
+
+class ReplicaPinningMiddleware:
+    """Закрепляет пользователя за основной базой на REPLICA_PIN_SECONDS после записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _pinned.set(bool(request.COOKIES.get(PIN_COOKIE)))
+        try:
+            response = self.get_response(request)
+            wrote = _pinned.get()
+        finally:
+            _pinned.reset(token)
+        # GET тоже может писать (счетчики просмотров) - закрепляем только после действий пользователя
+        if wrote and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(PIN_COOKIE, '1', max_age=get_pin_seconds(), httponly=True, samesite='Lax')
+        return response
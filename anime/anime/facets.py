@@ -0,0 +1,157 @@
+import bisect
+from collections import defaultdict
+
+from .indexes import InMemoryIndex
+from .models import Anime, Genre, Directors, Studio
+
+FACETS = (
+    ('genre', 'Жанры'),
+    ('directors', 'Режиссеры'),
+    ('studio', 'Студия'),
+    ('year', 'Год'),
+    ('status', 'Статус'),
+    ('age_rating', 'Рейтинг'),
+    ('season', 'Сезон'),
+    ('type', 'Тип'),
+)
+
+FACET_NAMES = [name for name, title in FACETS]
+
+CHOICE_FACETS = ('status', 'age_rating', 'season', 'type')
+
+
+def get_anime_values(anime_ids=None):
+    queryset = Anime.objects.order_by()
+    if anime_ids is not None:
+        queryset = queryset.filter(pk__in=anime_ids)
+    values = {}
+    for pk, studio_id, year, *choices in queryset.values_list('pk', 'studio_id', 'year', *CHOICE_FACETS):
+        values[pk] = {name: set() for name in FACET_NAMES}
+        values[pk]['studio'].add(str(studio_id))
+        values[pk]['year'].add(str(year.year))
+        for name, value in zip(CHOICE_FACETS, choices):
+            values[pk][name].add(value)
+    for name in ('genre', 'directors'):
+        through = getattr(Anime, name).through.objects.all()
+        if anime_ids is not None:
+            through = through.filter(anime_id__in=anime_ids)
+        for anime_id, value in through.values_list('anime_id', f'{name}_id'):
+            if anime_id in values:
+                values[anime_id][name].add(str(value))
+    return values
+
+
+class FacetIndex(InMemoryIndex):
+    refresh_interval_setting = 'FACET_INDEX_REFRESH_INTERVAL'
+
+    def load(self):
+        anime_values = get_anime_values()
+        index = {name: defaultdict(set) for name in FACET_NAMES}
+        for pk, values in anime_values.items():
+            for name in FACET_NAMES:
+                for value in values[name]:
+                    index[name][value].add(pk)
+        labels = {
+            'genre': {str(pk): name for pk, name in Genre.objects.values_list('pk', 'name')},
+            'directors': {str(pk): name for pk, name in Directors.objects.values_list('pk', 'name')},
+            'studio': {str(pk): name for pk, name in Studio.objects.values_list('pk', 'name')},
+        }
+        for name in CHOICE_FACETS:
+            labels[name] = dict(Anime._meta.get_field(name).choices)
+        titles = dict(Anime.objects.order_by().values_list('pk', 'title'))
+        return {
+            'index': {name: dict(values) for name, values in index.items()},
+            'anime': anime_values,
+            'labels': labels,
+            'all': set(anime_values),
+            # Порядок каталога (title, id) - выборка по фильтрам сортируется и режется на страницы без базы
+            'titles': titles,
+            'order': sorted((title, pk) for pk, title in titles.items() if pk in anime_values),
+        }
+
+    def update_anime(self, anime_id):
+        if self._data is None:
+            return
+        with self._lock:
+            data = self._data
+            if data is None:
+                return
+            fresh = get_anime_values([anime_id]).get(anime_id)
+            old = data['anime'].get(anime_id)
+            for name in FACET_NAMES:
+                old_values = old[name] if old else set()
+                new_values = fresh[name] if fresh else set()
+                for value in old_values - new_values:
+                    data['index'][name][value] = data['index'][name][value] - {anime_id}
+                for value in new_values - old_values:
+                    data['index'][name][value] = data['index'][name].get(value, set()) | {anime_id}
+            order = list(data['order'])
+            old_title = data['titles'].get(anime_id)
+            if old_title is not None:
+                position = bisect.bisect_left(order, (old_title, anime_id))
+                if position < len(order) and order[position] == (old_title, anime_id):
+                    del order[position]
+            if fresh:
+                title = Anime.objects.filter(pk=anime_id).values_list('title', flat=True).first()
+                data['titles'][anime_id] = title
+                bisect.insort(order, (title, anime_id))
+                data['anime'][anime_id] = fresh
+                data['all'] = data['all'] | {anime_id}
+            else:
+                data['titles'].pop(anime_id, None)
+                data['anime'].pop(anime_id, None)
+                data['all'] = data['all'] - {anime_id}
+            data['order'] = order
+
+    def select(self, selected, exclude=None):
+        data = self.get()
+        result = data['all']
+        for name, values in selected.items():
+            if name == exclude or not values:
+                continue
+            matched = set()
+            for value in values:
+                matched |= data['index'][name].get(value, set())
+            result = result & matched
+        return result
+
+    def ordered(self, anime_ids):
+        return [pk for title, pk in self.get()['order'] if pk in anime_ids]
+
+    def get_facets(self, selected, hidden=()):
+        data = self.get()
+        facets = []
+        for name, title in FACETS:
+            if name in hidden:
+                continue
+            base = self.select(selected, exclude=name)
+            labels = data['labels'].get(name, {})
+            options = []
+            for value, ids in list(data['index'][name].items()):
+                options.append({
+                    'value': value,
+                    'label': labels.get(value, value),
+                    'count': len(ids & base),
+                    'selected': value in selected.get(name, ()),
+                })
+            if name == 'year':
+                options.sort(key=lambda option: option['value'], reverse=True)
+            elif name in CHOICE_FACETS:
+                order = list(labels)
+                options.sort(key=lambda option: order.index(option['value']) if option['value'] in order else len(order))
+            else:
+                options.sort(key=lambda option: option['label'])
+            facets.append({'name': name, 'title': title, 'options': options})
+        return facets
+
+
+facet_index = FacetIndex()
+
+
+def get_selected_facets(query_dict):
+    selected = {}
+    for name in FACET_NAMES:
+        values = [value.strip() for value in query_dict.getlist(name) if value.strip()]
+        if values:
+            selected[name] = values
+    return selected
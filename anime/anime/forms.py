@@ -1,5 +1,7 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.forms import ModelForm, TextInput, Select, FileInput, Textarea, ModelChoiceField, RadioSelect
-from .models import Profile, Rating, RatingStar, Comment
+from .models import Profile, Rating, RatingStar, Comment, ListImport
 
 
 class ProfileUpdateForm(ModelForm):
@@ -34,3 +36,19 @@ class CommentForm(ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class ListImportForm(ModelForm):
+    class Meta:
+        model = ListImport
+        fields = ('file',)
+        widgets = {
+            'file': FileInput(attrs={'accept': '.csv,.xml'}),
+        }
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        max_size = getattr(settings, 'LIST_IMPORT_MAX_SIZE', 10 * 1024 * 1024)
+        if file and file.size > max_size:
+            raise ValidationError('Файл больше {} МБ'.format(max_size // (1024 * 1024)))
+        return file
@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .page_cache import bump_content_version
+from .workers import submit
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+
+# Ширина в CSS-пикселях; для каждого пресета строятся варианты 1x и 2x
+DEFAULT_PRESETS = {
+    'card': 280,
+    'sidebar': 360,
+    'detail': 300,
+    'thumb': 90,
+    'list': 120,
+    'avatar': 200,
+    'shot': 310,
+}
+
+DENSITIES = (1, 2)
+
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+_built_pending = False
+
+# Готовые превью не исчезают - положительная проверка файла запоминается в процессе
+_existing = set()
+MAX_EXISTING = 100000
+
+FIELD_PRESETS = {
+    'poster': ('card', 'sidebar', 'detail', 'thumb', 'list'),
+    'avatar': ('avatar',),
+    'shot': ('shot',),
+}
+
+FORMATS = {
+    'webp': ('WEBP', '.webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', '.png', {'optimize': True}),
+}
+
+
+def get_presets():
+    return getattr(settings, 'IMAGE_PRESETS', DEFAULT_PRESETS)
+
+
+def lazy_derivatives():
+    return getattr(settings, 'IMAGE_DERIVATIVES_LAZY', True)
+
+
+def fallback_format(name):
+    return 'png' if name.lower().endswith('.png') else 'jpeg'
+
+
+def derivative_name(name, width, fmt):
+    root, ext = os.path.splitext(name)
+    return f'{DERIVATIVES_DIR}/{width}/{root}{FORMATS[fmt][1]}'
+
+
+def generate_derivative(name, width, fmt):
+    target = derivative_name(name, width, fmt)
+    path = os.path.join(settings.MEDIA_ROOT, target)
+    pil_format, ext, options = FORMATS[fmt]
+    with Image.open(os.path.join(settings.MEDIA_ROOT, name)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        image.save(tmp_path, pil_format, **options)
+    os.replace(tmp_path, path)
+    return target
+
+
+def derivative_exists(target):
+    if target in _existing:
+        return True
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, target)):
+        return False
+    if len(_existing) >= MAX_EXISTING:
+        _existing.clear()
+    _existing.add(target)
+    return True
+
+
+def _run_derivative(name, width, fmt):
+    global _built_pending
+    built = False
+    try:
+        generate_derivative(name, width, fmt)
+        built = True
+    except (OSError, ValueError):
+        logger.exception('Не удалось построить превью %s (%s, %s)', name, width, fmt)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard((name, width, fmt))
+            _built_pending = _built_pending or built
+            # Страницы в кеше ссылаются на оригиналы - версия меняется один раз, когда очередь опустела
+            bump = _built_pending and not _in_flight
+            if bump:
+                _built_pending = False
+        if bump:
+            bump_content_version()
+
+
+def queue_derivative(name, width, fmt):
+    with _in_flight_lock:
+        if (name, width, fmt) in _in_flight:
+            return
+        _in_flight.add((name, width, fmt))
+    submit('images', 'IMAGE_WORKERS', _run_derivative, name, width, fmt)
+
+
+def ensure_derivative(name, width, fmt):
+    """Имя готового превью; недостающее ставится в фоновую очередь, а пока отдается оригинал."""
+    target = derivative_name(name, width, fmt)
+    if derivative_exists(target):
+        return target
+    if lazy_derivatives():
+        queue_derivative(name, width, fmt)
+    raise FileNotFoundError(target)
+
+
+def get_derivative_url(file_field, preset, fmt='webp', density=1):
+    if not file_field:
+        return ''
+    name = file_field.name
+    if fmt == 'fallback':
+        fmt = fallback_format(name)
+    try:
+        width = get_presets()[preset] * density
+        return settings.MEDIA_URL + ensure_derivative(name, width, fmt)
+    except FileNotFoundError:
+        return file_field.url
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning('Нет производного изображения %s (%s, %s): %s', name, preset, fmt, e)
+        return file_field.url
+
+
+def generate_derivatives(name, presets, force=False):
+    created = 0
+    for preset in presets:
+        for density in DENSITIES:
+            width = get_presets()[preset] * density
+            for fmt in ('webp', fallback_format(name)):
+                target = os.path.join(settings.MEDIA_ROOT, derivative_name(name, width, fmt))
+                if force or not os.path.exists(target):
+                    generate_derivative(name, width, fmt)
+                    created += 1
+    return created
+
+
+def schedule_derivatives(file_field, field_name):
+    if not file_field:
+        return
+    name = file_field.name
+
+    def run():
+        try:
+            created = generate_derivatives(name, FIELD_PRESETS[field_name])
+        except (OSError, ValueError):
+            logger.exception('Не удалось построить превью для %s', name)
+            return
+        if created:
+            bump_content_version()
+
+    transaction.on_commit(lambda: submit('images', 'IMAGE_WORKERS', run))
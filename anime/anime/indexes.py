@@ -0,0 +1,34 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class InMemoryIndex:
+    refresh_interval_setting = None
+    default_refresh_interval = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0
+
+    def get_refresh_interval(self):
+        return getattr(settings, self.refresh_interval_setting, self.default_refresh_interval)
+
+    def is_stale(self):
+        return self._data is None or time.monotonic() - self._loaded_at > self.get_refresh_interval()
+
+    def get(self):
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self._data = self.load()
+                    self._loaded_at = time.monotonic()
+        return self._data
+
+    def invalidate(self):
+        self._data = None
+
+    def load(self):
+        raise NotImplementedError
@@ -0,0 +1,299 @@
+import csv
+import datetime
+import json
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .facets import facet_index
+from .models import Anime, Directors, Genre, Studio
+from .page_cache import bump_content_version
+from .random_pick import random_picker
+from .search import search_index, update_search_vector
+from .sidebar import invalidate_sidebar
+
+ANIME_FIELDS = (
+    'title', 'second_title', 'poster', 'description', 'year', 'total_series',
+    'status', 'age_rating', 'season', 'type', 'studio',
+)
+
+CHOICE_FIELDS = ('status', 'age_rating', 'season', 'type')
+
+# Необязательные поля: при обновлении меняются только те, что есть в записи, новые аниме получают эти значения
+OPTIONAL_DEFAULTS = {
+    'second_title': None,
+    'poster': '',
+    'description': '',
+    'total_series': 0,
+}
+
+LIST_SEPARATORS = ('|', ';')
+
+SLUG_LENGTH = 50
+
+MAX_REPORTED_ERRORS = 20
+
+
+class IngestError(ValueError):
+    pass
+
+
+def read_jsonl(file):
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise IngestError(f'Строка {number}: {e}')
+
+
+def split_list(value):
+    if not value:
+        return []
+    for separator in LIST_SEPARATORS:
+        if separator in value:
+            return [item.strip() for item in value.split(separator) if item.strip()]
+    return [value.strip()]
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        # Без колонки связи не трогаются, пустая ячейка - очищает их
+        for name in ('genres', 'directors'):
+            if name in row:
+                row[name] = split_list(row[name])
+        yield row
+
+
+READERS = {
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+def make_slug(value):
+    return slugify(value or '')[:SLUG_LENGTH].strip('-')
+
+
+def generated_url_base(record):
+    return make_slug(record.get('second_title')) or make_slug(record.get('title'))
+
+
+def parse_year(value):
+    if isinstance(value, int):
+        return datetime.date(value, 1, 1)
+    value = str(value or '').strip()
+    if len(value) == 4 and value.isdigit():
+        return datetime.date(int(value), 1, 1)
+    try:
+        return datetime.date.fromisoformat(value[:10])
+    except ValueError:
+        raise IngestError(f'Неверный год: {value!r}')
+
+
+def taxonomy_item(value):
+    """Элемент справочника в дампе: строка-название или {"name": ..., "url": ...}."""
+    if isinstance(value, dict):
+        name = (value.get('name') or '').strip()
+        slug = (value.get('url') or '').strip() or make_slug(name)
+    else:
+        name = str(value).strip()
+        slug = make_slug(name)
+    if not name or not slug:
+        raise IngestError(f'Неверное значение справочника: {value!r}')
+    return slug, name
+
+
+class TaxonomyResolver:
+    """Находит или создает Genre/Directors/Studio по slug пачками и кеширует id на время загрузки."""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {}
+
+    def resolve(self, items):
+        missing = {slug: name for slug, name in items if slug not in self.ids}
+        if missing:
+            self.ids.update(self.model.objects.filter(url__in=missing).values_list('url', 'pk'))
+            new = [self.model(url=slug, name=name) for slug, name in missing.items() if slug not in self.ids]
+            if new:
+                self.model.objects.bulk_create(new, ignore_conflicts=True)
+                self.ids.update(self.model.objects.filter(url__in=[item.url for item in new]).values_list('url', 'pk'))
+        return self.ids
+
+
+class CatalogIngestor:
+
+    def __init__(self, batch_size=1000, update=True):
+        self.batch_size = batch_size
+        self.update = update
+        self.genres = TaxonomyResolver(Genre)
+        self.directors = TaxonomyResolver(Directors)
+        self.studios = TaxonomyResolver(Studio)
+        self.choices = {name: dict(Anime._meta.get_field(name).choices) for name in CHOICE_FIELDS}
+        self.seen_urls = set()
+        self.db_urls = {}
+        self.touched = []
+        self.stats = {'created': 0, 'updated': 0, 'skipped': 0, 'errors': 0}
+        self.errors = []
+
+    def ingest(self, records):
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        self.finish()
+        return self.stats
+
+    def check_generated_urls(self, records):
+        """Одним запросом на пачку проверяет, заняты ли в базе url, которые будут сгенерированы."""
+        bases = set()
+        for record in records:
+            if isinstance(record, dict) and not str(record.get('url') or '').strip():
+                base = generated_url_base(record)
+                if base and base not in self.db_urls:
+                    bases.add(base)
+        if bases:
+            taken = set(Anime.objects.filter(url__in=bases).values_list('url', flat=True))
+            self.db_urls.update((base, base in taken) for base in bases)
+
+    def url_taken(self, url):
+        if url in self.seen_urls:
+            return True
+        if url not in self.db_urls:
+            self.db_urls[url] = Anime.objects.filter(url=url).exists()
+        return self.db_urls[url]
+
+    def assign_url(self, record):
+        url = (record.get('url') or '').strip()
+        if url:
+            return url
+        # Сгенерированный url никогда не совпадает с существующим аниме: upsert только по явному url
+        base = generated_url_base(record)
+        if not base:
+            raise IngestError('Не удалось построить url: нет латинского названия')
+        url, suffix = base, 2
+        while self.url_taken(url):
+            url = f'{base[:SLUG_LENGTH - len(str(suffix)) - 1]}-{suffix}'
+            suffix += 1
+        return url
+
+    def clean(self, record):
+        url = self.assign_url(record)
+        if url in self.seen_urls:
+            raise IngestError(f'Повтор url в дампе: {url}')
+        values = {
+            'url': url,
+            'title': (record.get('title') or '').strip(),
+            'year': parse_year(record.get('year')),
+        }
+        if 'second_title' in record:
+            values['second_title'] = (record['second_title'] or '').strip() or None
+        if 'poster' in record:
+            values['poster'] = (record['poster'] or '').strip()
+        if 'description' in record:
+            values['description'] = record['description'] or ''
+        if 'total_series' in record:
+            values['total_series'] = int(record['total_series'] or 0)
+        if not values['title']:
+            raise IngestError(f'{url}: нет названия')
+        for name in CHOICE_FIELDS:
+            value = (record.get(name) or '').strip()
+            if value not in self.choices[name]:
+                raise IngestError(f'{url}: неверное значение {name}={value!r}')
+            values[name] = value
+        studio = record.get('studio')
+        if not studio:
+            raise IngestError(f'{url}: нет студии')
+        values['studio'] = taxonomy_item(studio)
+        relations = {}
+        for name in ('genres', 'directors'):
+            if name in record:
+                relations[name] = [taxonomy_item(item) for item in record[name] or []]
+        return values, relations
+
+    def write_batch(self, records):
+        self.check_generated_urls(records)
+        cleaned = []
+        for record in records:
+            try:
+                values, relations = self.clean(record)
+            except (IngestError, TypeError, ValueError) as e:
+                self.stats['errors'] += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append(str(e))
+                continue
+            self.seen_urls.add(values['url'])
+            cleaned.append((values, relations))
+        if not cleaned:
+            return
+
+        studio_ids = self.studios.resolve(values['studio'] for values, relations in cleaned)
+        genre_ids = self.genres.resolve(
+            item for values, relations in cleaned for item in relations.get('genres', ()))
+        director_ids = self.directors.resolve(
+            item for values, relations in cleaned for item in relations.get('directors', ()))
+
+        with transaction.atomic():
+            urls = [values['url'] for values, relations in cleaned]
+            existing = {anime.url: anime for anime in Anime.objects.filter(url__in=urls).only('pk', 'url')}
+            created, updated = [], []
+            # Обновление группируется по набору полей: отсутствующие в записи поля не перезаписываются
+            update_groups = {}
+            for values, relations in cleaned:
+                studio_slug, studio_name = values.pop('studio')
+                values['studio_id'] = studio_ids[studio_slug]
+                anime = existing.get(values['url'])
+                if anime is None:
+                    created.append(Anime(**{**OPTIONAL_DEFAULTS, **values}))
+                elif self.update:
+                    for name, value in values.items():
+                        setattr(anime, name, value)
+                    updated.append(anime)
+                    fields = tuple(name for name in ANIME_FIELDS if name in values or f'{name}_id' in values)
+                    update_groups.setdefault(fields, []).append(anime)
+                else:
+                    self.stats['skipped'] += 1
+            Anime.objects.bulk_create(created, batch_size=self.batch_size)
+            for fields, group in update_groups.items():
+                Anime.objects.bulk_update(group, fields, batch_size=self.batch_size)
+            url_ids = dict(Anime.objects.filter(url__in=urls).values_list('url', 'pk'))
+
+            # Связи перезаписываются только у созданных и обновленных аниме, у которых они есть в дампе
+            written = {anime.url for anime in created + updated}
+            for name, ids, through, column in (
+                ('genres', genre_ids, Anime.genre.through, 'genre_id'),
+                ('directors', director_ids, Anime.directors.through, 'directors_id'),
+            ):
+                targets = [(url_ids[values['url']], relations[name]) for values, relations in cleaned
+                           if name in relations and values['url'] in written]
+                if not targets:
+                    continue
+                existing_pks = {anime.pk for anime in updated}
+                through.objects.filter(anime_id__in=[pk for pk, items in targets if pk in existing_pks]).delete()
+                rows = {(anime_id, ids[slug]) for anime_id, items in targets for slug, item_name in items}
+                through.objects.bulk_create(
+                    [through(**{'anime_id': anime_id, column: value}) for anime_id, value in rows],
+                    batch_size=self.batch_size, ignore_conflicts=True,
+                )
+
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(updated)
+        self.touched.extend(url_ids[url] for url in written)
+
+    def finish(self):
+        if not self.touched:
+            return
+        for start in range(0, len(self.touched), self.batch_size):
+            update_search_vector(self.touched[start:start + self.batch_size])
+        search_index.invalidate()
+        facet_index.invalidate()
+        random_picker.invalidate()
+        invalidate_sidebar()
+        bump_content_version()
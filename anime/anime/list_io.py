@@ -0,0 +1,264 @@
+import csv
+import io
+import logging
+import os
+from xml.sax.saxutils import escape
+
+from defusedxml.ElementTree import iterparse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Subquery
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import Anime, AnimeListEntry, ListImport, Rating, RatingStar
+from .page_cache import bump_content_version
+from .utils import recompute_rating_aggregates
+from .workers import submit
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ('url', 'title', 'second_title', 'status', 'favorite', 'rating', 'updated_date')
+
+MAL_STATUSES = {
+    'watching': 'Watching',
+    'viewed': 'Completed',
+    'throw': 'Dropped',
+    'will_watch': 'Plan to Watch',
+}
+
+MAL_STATUS_IMPORT = {
+    'watching': 'watching',
+    'completed': 'viewed',
+    'on-hold': 'will_watch',
+    'dropped': 'throw',
+    'plan to watch': 'will_watch',
+    '1': 'watching',
+    '2': 'viewed',
+    '3': 'will_watch',
+    '4': 'throw',
+    '6': 'will_watch',
+}
+
+MAL_MAX_SCORE = 10
+
+BATCH_SIZE = 500
+
+
+def get_chunk_size():
+    return getattr(settings, 'LIST_EXPORT_CHUNK_SIZE', 2000)
+
+
+def get_max_star():
+    return RatingStar.objects.aggregate(value=Max('value'))['value'] or MAL_MAX_SCORE
+
+
+def export_rows(profile):
+    rating = Rating.objects.filter(profile=profile, anime_id=OuterRef('anime_id')).values('star__value')[:1]
+    entries = AnimeListEntry.objects.filter(profile=profile).annotate(rating=Subquery(rating)).order_by('pk').\
+        values_list('anime__url', 'anime__title', 'anime__second_title', 'status', 'favorite', 'rating', 'updated_date')
+    yield from entries.iterator(chunk_size=get_chunk_size())
+    in_list = AnimeListEntry.objects.filter(profile=profile, anime_id=OuterRef('anime_id'))
+    ratings = Rating.objects.filter(profile=profile).filter(~Exists(in_list)).order_by('pk').\
+        values_list('anime__url', 'anime__title', 'anime__second_title', 'star__value')
+    for url, title, second_title, value in ratings.iterator(chunk_size=get_chunk_size()):
+        yield url, title, second_title, None, False, value, None
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(profile):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for url, title, second_title, status, favorite, rating, updated_date in export_rows(profile):
+        yield writer.writerow((
+            url, title, second_title or '', status or '', int(favorite), rating or '',
+            updated_date.isoformat() if updated_date else '',
+        ))
+
+
+def iter_mal_xml(profile):
+    max_star = get_max_star()
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<myanimelist>\n' \
+          '  <myinfo>\n    <user_export_type>1</user_export_type>\n  </myinfo>\n'
+    # Строки только с оценкой выгружаются с пустым статусом, чтобы импорт не создал запись в списке
+    for url, title, second_title, status, favorite, rating, updated_date in export_rows(profile):
+        score = round(rating * MAL_MAX_SCORE / max_star) if rating else 0
+        yield (
+            '  <anime>\n'
+            f'    <series_title>{escape(title)}</series_title>\n'
+            f'    <anime_storage_url>{escape(url)}</anime_storage_url>\n'
+            f'    <my_status>{MAL_STATUSES.get(status, "")}</my_status>\n'
+            f'    <my_score>{score}</my_score>\n'
+            '    <update_on_import>1</update_on_import>\n'
+            '  </anime>\n'
+        )
+    yield '</myanimelist>\n'
+
+
+def parse_csv(file):
+    for row in csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline='')):
+        yield {
+            'url': (row.get('url') or '').strip(),
+            'title': (row.get('title') or '').strip(),
+            'second_title': (row.get('second_title') or '').strip(),
+            'status': (row.get('status') or '').strip() or None,
+            'favorite': (row.get('favorite') or '').strip().lower() in ('1', 'true', 'yes'),
+            'rating': (row.get('rating') or '').strip(),
+            'scale': None,
+        }
+
+
+def parse_mal_xml(file):
+    for event, element in iterparse(file, events=('end',)):
+        if element.tag != 'anime':
+            continue
+        status = (element.findtext('my_status') or '').strip().lower()
+        yield {
+            'url': (element.findtext('anime_storage_url') or '').strip(),
+            'title': (element.findtext('series_title') or '').strip(),
+            'second_title': '',
+            'status': MAL_STATUS_IMPORT.get(status),
+            'favorite': False,
+            'rating': (element.findtext('my_score') or '').strip(),
+            'scale': MAL_MAX_SCORE,
+        }
+        element.clear()
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'xml': parse_mal_xml,
+}
+
+
+def detect_format(filename):
+    return 'xml' if os.path.splitext(filename)[1].lower() == '.xml' else 'csv'
+
+
+def match_anime(rows):
+    """Находит аниме для пачки строк: сначала по url, затем по названию и второму названию."""
+    matched = {}
+    urls = {row['url'] for row in rows if row['url']}
+    by_url = dict(Anime.objects.filter(url__in=urls).values_list('url', 'pk')) if urls else {}
+    titles = set()
+    for row in rows:
+        if row['url'] not in by_url:
+            titles.update(title.lower() for title in (row['title'], row['second_title']) if title)
+    by_title = {}
+    if titles:
+        queryset = Anime.objects.annotate(lower_title=Lower('title')).filter(lower_title__in=titles)
+        by_title.update(queryset.values_list('lower_title', 'pk'))
+        queryset = Anime.objects.annotate(lower_title=Lower('second_title')).filter(lower_title__in=titles)
+        for title, pk in queryset.values_list('lower_title', 'pk'):
+            by_title.setdefault(title, pk)
+    for row in rows:
+        anime_id = by_url.get(row['url']) or by_title.get(row['title'].lower()) or \
+            by_title.get(row['second_title'].lower())
+        if anime_id:
+            matched[anime_id] = row
+    return matched
+
+
+def normalize_rating(value, scale, stars, max_star):
+    try:
+        value = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    if scale:
+        value = max(1, round(value * max_star / scale))
+    return stars.get(min(value, max_star))
+
+
+def write_import(profile, matched):
+    statuses = dict(AnimeListEntry.STATUS_CHOICES)
+    stars = {star.value: star for star in RatingStar.objects.all()}
+    max_star = max(stars) if stars else 0
+    now = timezone.now()
+    anime_ids = list(matched)
+    with transaction.atomic():
+        existing = {}
+        for start in range(0, len(anime_ids), BATCH_SIZE):
+            batch = anime_ids[start:start + BATCH_SIZE]
+            existing.update((entry.anime_id, entry) for entry in
+                            AnimeListEntry.objects.filter(profile=profile, anime_id__in=batch))
+        created, updated = [], []
+        for anime_id, row in matched.items():
+            status = row['status'] if row['status'] in statuses else None
+            entry = existing.get(anime_id)
+            if entry is None:
+                if status or row['favorite']:
+                    created.append(AnimeListEntry(profile=profile, anime_id=anime_id, status=status,
+                                                  favorite=row['favorite']))
+            elif (status and status != entry.status) or (row['favorite'] and not entry.favorite):
+                entry.status = status or entry.status
+                entry.favorite = entry.favorite or row['favorite']
+                entry.updated_date = now
+                updated.append(entry)
+        AnimeListEntry.objects.bulk_create(created, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        AnimeListEntry.objects.bulk_update(updated, ['status', 'favorite', 'updated_date'], batch_size=BATCH_SIZE)
+
+        ratings = {rating.anime_id: rating for rating in Rating.objects.filter(profile=profile)}
+        new_ratings, changed_ratings = [], []
+        for anime_id, row in matched.items():
+            star = normalize_rating(row['rating'], row['scale'], stars, max_star) if stars else None
+            if star is None:
+                continue
+            rating = ratings.get(anime_id)
+            if rating is None:
+                new_ratings.append(Rating(profile=profile, anime_id=anime_id, star=star))
+            elif rating.star_id != star.pk:
+                rating.star = star
+                changed_ratings.append(rating)
+        # Оценка могла появиться параллельно (rate_anime) - такая строка пропускается, агрегаты все равно пересчитываются
+        Rating.objects.bulk_create(new_ratings, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        Rating.objects.bulk_update(changed_ratings, ['star'], batch_size=BATCH_SIZE)
+        rated = [rating.anime_id for rating in new_ratings + changed_ratings]
+        for start in range(0, len(rated), BATCH_SIZE):
+            recompute_rating_aggregates(rated[start:start + BATCH_SIZE])
+    if rated:
+        bump_content_version()
+    return len(created) + len(updated), len(rated)
+
+
+def run_import(import_id):
+    list_import = ListImport.objects.select_related('profile').get(pk=import_id)
+    ListImport.objects.filter(pk=import_id).update(status='running')
+    matched = {}
+    processed = 0
+    try:
+        with open(list_import.file.path, 'rb') as file:
+            batch = []
+            for row in PARSERS[list_import.format](file):
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    matched.update(match_anime(batch))
+                    processed += len(batch)
+                    batch = []
+                    ListImport.objects.filter(pk=import_id).update(processed=processed, matched=len(matched))
+            if batch:
+                matched.update(match_anime(batch))
+                processed += len(batch)
+        ListImport.objects.filter(pk=import_id).update(processed=processed, matched=len(matched))
+        write_import(list_import.profile, matched)
+    except Exception as e:
+        logger.exception('Не удалось импортировать список %s', import_id)
+        ListImport.objects.filter(pk=import_id).update(status='failed', error=str(e)[:1000], finished_date=timezone.now())
+        return False
+    ListImport.objects.filter(pk=import_id).update(status='done', finished_date=timezone.now())
+    list_import.file.delete(save=False)
+    return True
+
+
+def schedule_import(list_import):
+    if list_import.file.size <= getattr(settings, 'LIST_IMPORT_SYNC_MAX_SIZE', 256 * 1024):
+        return run_import(list_import.pk)
+    import_id = list_import.pk
+    transaction.on_commit(lambda: submit('list-import', 'LIST_IMPORT_WORKERS', run_import, import_id))
+    return None
@@ -0,0 +1,119 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from anime.benchmark import get_scenarios
+from anime.middleware import query_shape
+
+
+def read_log(path):
+    """Лог запросов: JSON lines с полями sql/params или SQL, разделенный ';' в конце строки."""
+    with open(path) as file:
+        content = file.read()
+    if content.lstrip().startswith('{'):
+        for line in content.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                yield item['sql'], item.get('params')
+        return
+    statement = []
+    for line in content.splitlines():
+        statement.append(line)
+        if line.rstrip().endswith(';'):
+            yield '\n'.join(statement).rstrip().rstrip(';'), None
+            statement = []
+    if ''.join(statement).strip():
+        yield '\n'.join(statement), None
+
+
+def capture_benchmark():
+    """Запросы страниц из сценариев бенчмарка (нужен набор seed_benchmark)."""
+    with override_settings(PAGE_CACHE_ENABLED=False, ALLOWED_HOSTS=['testserver'], DATABASE_REPLICAS=[]):
+        scenarios, profile = get_scenarios()
+        if not scenarios:
+            raise CommandError('Нет данных: сначала выполните seed_benchmark')
+        anonymous, authenticated = Client(), Client()
+        authenticated.force_login(profile.user)
+        for name, url, login in scenarios:
+            with CaptureQueriesContext(connection) as queries:
+                (authenticated if login else anonymous).get(url)
+            for query in queries.captured_queries:
+                yield query['sql'], None
+
+
+def iter_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from iter_nodes(child)
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет запросы из лога или бенчмарка через EXPLAIN ANALYZE и находит seq scan и сортировки на диске'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help='Файл с запросами (JSON lines {"sql", "params"} или SQL через ";")')
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='Seq scan по таблицам меньше этого числа строк не показывается')
+        parser.add_argument('--report', help='Куда записать JSON-отчет')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN (ANALYZE, FORMAT JSON) поддерживается только на PostgreSQL')
+        queries = read_log(options['log']) if options['log'] else capture_benchmark()
+
+        seen = set()
+        findings = {}
+        for sql, params in queries:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            shape = query_shape(sql)
+            if shape in seen:
+                continue
+            seen.add(shape)
+            try:
+                plan = self.explain(sql, params)
+            except DatabaseError as e:
+                self.stderr.write(f'Пропущен запрос ({e}): {sql[:200]}')
+                continue
+            for finding in self.find_problems(plan, options['min_rows']):
+                key = (finding['problem'], finding['relation'], finding['detail'])
+                item = findings.setdefault(key, dict(finding, count=0, sql=sql[:1000]))
+                item['count'] += 1
+                item['ms'] = max(item['ms'], finding['ms'])
+
+        report = sorted(findings.values(), key=lambda item: -item['ms'])
+        if options['report']:
+            with open(options['report'], 'w') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        for item in report:
+            self.stdout.write(
+                f'{item["problem"]:<10} {item["relation"] or "-":<32} rows={item["rows"]:<9} '
+                f'ms={item["ms"]:<9} x{item["count"]}  {item["detail"]}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Проверено запросов: {len(seen)}, проблем: {len(report)}'))
+
+    def explain(self, sql, params):
+        # ANALYZE выполняет запрос - только SELECT и с откатом транзакции
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            transaction.set_rollback(True)
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']
+
+    def find_problems(self, plan, min_rows):
+        for node in iter_nodes(plan):
+            rows = node.get('Actual Rows', 0) * node.get('Actual Loops', 1) + node.get('Rows Removed by Filter', 0)
+            ms = round(node.get('Actual Total Time', 0) * node.get('Actual Loops', 1), 2)
+            if node['Node Type'] == 'Seq Scan' and rows >= min_rows:
+                yield {'problem': 'seq_scan', 'relation': node.get('Relation Name'), 'rows': rows, 'ms': ms,
+                       'detail': node.get('Filter', '')}
+            elif node['Node Type'] in ('Sort', 'Incremental Sort') and (
+                    node.get('Sort Space Type') == 'Disk' or 'external' in node.get('Sort Method', '')):
+                yield {'problem': 'sort_spill', 'relation': None, 'rows': rows, 'ms': ms,
+                       'detail': ', '.join(node.get('Sort Key', []))}
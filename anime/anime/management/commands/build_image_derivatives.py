@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from anime.images import FIELD_PRESETS, generate_derivatives
+from anime.models import Anime, AnimeShot, Profile
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии и WebP для постеров, аватаров и кадров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перестроить уже существующие файлы')
+
+    def handle(self, *args, **options):
+        sources = (
+            (Anime, 'poster'),
+            (Profile, 'avatar'),
+            (AnimeShot, 'shot'),
+        )
+        created = failed = 0
+        for model, field_name in sources:
+            names = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for name in names.values_list(field_name, flat=True).distinct().iterator():
+                try:
+                    created += generate_derivatives(name, FIELD_PRESETS[field_name], force=options['force'])
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'{name}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Создано файлов: {created}, ошибок: {failed}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from anime.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Строит персональные рекомендации по оценкам и спискам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = build_recommendations(top_n=options['top_n'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Сохранено рекомендаций: {created}'))
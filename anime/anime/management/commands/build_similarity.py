@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from anime.similarity import build_similarity
+
+
+class Command(BaseCommand):
+    help = 'Строит таблицу похожих аниме по жанрам, режиссерам, студии, типу и году'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        created = build_similarity(batch_size=options['batch_size'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Сохранено пар похожих аниме: {created}'))
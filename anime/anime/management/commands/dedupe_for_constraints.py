@@ -0,0 +1,49 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from anime.models import Anime, Ip, Rating
+
+
+class Command(BaseCommand):
+    help = 'Удаляет дубли Ip.ip и Rating(profile, anime) перед применением уникальных ограничений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ips = self.dedupe_ips()
+            ratings = self.dedupe_ratings()
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        if not options['dry_run'] and (ips or ratings):
+            call_command('rebuild_counters', stdout=self.stdout)
+            call_command('rebuild_ratings', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Удалено дублей: ip {ips}, оценок {ratings}'))
+
+    def dedupe_ips(self):
+        through = Anime.views.through
+        duplicates = Ip.objects.values('ip').annotate(keep=Min('pk'), total=Count('pk')).filter(total__gt=1)
+        removed = 0
+        for row in duplicates.iterator():
+            extra = list(Ip.objects.filter(ip=row['ip']).exclude(pk=row['keep']).values_list('pk', flat=True))
+            # Просмотры дублей переносятся на оставшийся адрес, повторные пары отбрасываются
+            anime_ids = set(through.objects.filter(ip_id__in=extra).values_list('anime_id', flat=True))
+            through.objects.bulk_create([through(anime_id=anime_id, ip_id=row['keep']) for anime_id in anime_ids],
+                                        ignore_conflicts=True)
+            Ip.objects.filter(pk__in=extra).delete()
+            removed += len(extra)
+        return removed
+
+    def dedupe_ratings(self):
+        # Остается последняя оценка пользователя
+        duplicates = Rating.objects.values('profile_id', 'anime_id').annotate(keep=Max('pk'), total=Count('pk')).\
+            filter(total__gt=1)
+        removed = 0
+        for row in duplicates.iterator():
+            deleted, _ = Rating.objects.filter(profile_id=row['profile_id'], anime_id=row['anime_id']).\
+                exclude(pk=row['keep']).delete()
+            removed += deleted
+        return removed
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from anime.tracking import SpoolViewBuffer, get_view_buffer
+
+
+class Command(BaseCommand):
+    help = ('Записывает накопленные просмотры из файла-спула в базу данных '
+            '(только VIEWS_TRACKING_BACKEND = "spool": буфер в памяти сбрасывает сам процесс сайта)')
+
+    def handle(self, *args, **options):
+        buffer = get_view_buffer()
+        if not isinstance(buffer, SpoolViewBuffer):
+            raise CommandError('Просмотры хранятся в памяти процессов сайта - сбрасывать нечего. '
+                               'Команда работает только с VIEWS_TRACKING_BACKEND = "spool"')
+        flushed = buffer.flush()
+        self.stdout.write(self.style.SUCCESS(f'Записано просмотров: {flushed}'))
@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from anime.ingest import READERS, CatalogIngestor, IngestError
+
+
+class Command(BaseCommand):
+    help = 'Загружает каталог аниме из JSON Lines или CSV (upsert по url)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-update', action='store_true', help='Не обновлять уже существующие аниме')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'jsonl')
+        if not os.path.exists(options['path']):
+            raise CommandError(f'Файл не найден: {options["path"]}')
+        ingestor = CatalogIngestor(batch_size=options['batch_size'], update=not options['no_update'])
+        started = time.monotonic()
+        with open(options['path'], encoding='utf-8-sig', newline='') as file:
+            try:
+                stats = ingestor.ingest(READERS[fmt](file))
+            except IngestError as e:
+                raise CommandError(str(e))
+        elapsed = max(time.monotonic() - started, 1e-6)
+        for message in ingestor.errors:
+            self.stderr.write(message)
+        total = stats['created'] + stats['updated'] + stats['skipped']
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {stats["created"]}, обновлено: {stats["updated"]}, пропущено: {stats["skipped"]}, '
+            f'ошибок: {stats["errors"]}, {total / elapsed:.0f} строк/с'
+        ))
+        self.stdout.write('Похожие аниме пересчитываются отдельно: manage.py build_similarity')
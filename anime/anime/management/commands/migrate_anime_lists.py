@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from anime.models import AnimeListEntry, WatchingNow, WillWatch, Viewed, Throw, Favorite
+
+LEGACY_STATUSES = (
+    (WatchingNow, 'watching'),
+    (WillWatch, 'will_watch'),
+    (Viewed, 'viewed'),
+    (Throw, 'throw'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Переносит списки из старых моделей (WatchingNow, WillWatch, Viewed, Throw, Favorite) в AnimeListEntry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        entries = {}
+        for model, status in LEGACY_STATUSES:
+            rows = model.objects.filter(anime__isnull=False).order_by('pk').values_list('user_id', 'anime_id')
+            for key in rows.iterator():
+                entries.setdefault(key, {'status': None, 'favorite': False})['status'] = status
+        for key in Favorite.objects.filter(anime__isnull=False).values_list('user_id', 'anime_id').iterator():
+            entries.setdefault(key, {'status': None, 'favorite': False})['favorite'] = True
+
+        objects = [
+            AnimeListEntry(profile_id=profile_id, anime_id=anime_id, **values)
+            for (profile_id, anime_id), values in entries.items()
+        ]
+        with transaction.atomic():
+            AnimeListEntry.objects.bulk_create(objects, batch_size=options['batch_size'], ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(f'Перенесено записей: {len(objects)}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from anime.models import Video
+from anime.transcoding import package_video
+
+
+class Command(BaseCommand):
+    help = 'Упаковывает серии в HLS (по умолчанию - все, что еще не готово)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int)
+        parser.add_argument('--all', action='store_true', help='Перепаковать все серии')
+
+    def handle(self, *args, **options):
+        queryset = Video.objects.order_by('pk')
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+        elif not options['all']:
+            queryset = queryset.exclude(hls_status='ready')
+        done = failed = 0
+        for video_id in queryset.values_list('pk', flat=True):
+            if package_video(video_id):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Упаковано серий: {done}, с ошибкой: {failed}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from anime.models import Anime, Comment, Rating
+from anime.utils import aggregate_subquery
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики просмотров, комментариев и оценок у аниме'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = Anime.objects.update(
+                views_count=aggregate_subquery(Anime.views.through.objects.all(), Count('*')),
+                comments_count=aggregate_subquery(Comment.objects.all(), Count('*')),
+                ratings_count=aggregate_subquery(Rating.objects.all(), Count('*')),
+            )
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано счетчиков: {updated}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from anime.utils import recompute_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сумму, количество оценок и взвешенный рейтинг у аниме'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = recompute_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано рейтингов: {updated}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from anime.search import update_search_vector
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы аниме (GIN-индексы создаются миграциями)'
+
+    def handle(self, *args, **options):
+        update_search_vector()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс обновлен'))
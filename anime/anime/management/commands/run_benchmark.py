@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from anime.benchmark import get_budgets, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет страницы через тестовый клиент и проверяет бюджеты запросов и времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--only', nargs='*', help='Имена сценариев')
+        parser.add_argument('--budgets', help='JSON с бюджетами {"сценарий": {"queries": 10, "wall_ms": 200}}')
+        parser.add_argument('--report', help='Куда записать JSON-отчет')
+        parser.add_argument('--page-cache', action='store_true', help='Не отключать кеш страниц')
+
+    def handle(self, *args, **options):
+        budgets = get_budgets()
+        if options['budgets']:
+            with open(options['budgets']) as file:
+                budgets = {**budgets, **json.load(file)}
+        report = run_benchmarks(
+            repeat=options['repeat'], budgets=budgets, only=options['only'], page_cache=options['page_cache'],
+        )
+        report['budgets'] = budgets
+        if options['report']:
+            with open(options['report'], 'w') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<18} {result["status"]} queries={result["queries"]:<4} sql={result["sql_ms"]:.1f}ms '
+                f'wall={result["wall_ms"]:.1f}ms max={result["wall_ms_max"]:.1f}ms peak={result["peak_kb"]:.0f}KB'
+            )
+        if report['failures']:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(report['failures']))
+        self.stdout.write(self.style.SUCCESS('Все сценарии уложились в бюджеты'))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from anime.benchmark import SIZES, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Заполняет БД детерминированным набором данных для бенчмарка (аниме bench-*, пользователи bench_*)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=list(SIZES), default='small')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--force', action='store_true', help='Разрешить запуск при DEBUG = False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Набор для бенчмарка не создается на боевой БД без --force')
+        counts = seed_dataset(size=options['size'], seed=options['seed'], stdout=self.stdout)
+        summary = ', '.join(f'{name}: {value}' for name, value in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Набор {options["size"]} создан ({summary})'))
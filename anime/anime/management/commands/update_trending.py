@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from anime.page_cache import bump_content_version
+from anime.sidebar import invalidate_sidebar
+from anime.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает почасовую активность в дневную и пересчитывает актуальность аниме'
+
+    def handle(self, *args, **options):
+        updated = update_trending()
+        invalidate_sidebar()
+        bump_content_version()
+        self.stdout.write(self.style.SUCCESS(f'Аниме с ненулевой актуальностью: {updated}'))
@@ -0,0 +1,127 @@
+import heapq
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.functional import empty
+
+logger = logging.getLogger('anime.sql')
+
+IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+
+def query_shape(sql):
+    """Форма запроса без литералов: запросы из одного цикла (N+1) дают одинаковую форму."""
+    sql = IN_LIST_RE.sub('(...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+class QueryStats:
+    """Счетчики запросов одного HTTP-запроса, собираются через connection.execute_wrapper."""
+
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.slowest = []
+        self.slowest_limit = slowest
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            self.shapes[sql] += 1
+            item = (duration, self.count, sql)
+            if len(self.slowest) < self.slowest_limit:
+                heapq.heappush(self.slowest, item)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def get_duplicates(self, threshold):
+        # Формы считаются лениво, только при отчете - в горячем пути один Counter по исходному SQL
+        shapes = Counter()
+        for sql, count in self.shapes.items():
+            shapes[query_shape(sql)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def get_slowest(self):
+        return [(duration, sql) for duration, number, sql in sorted(self.slowest, reverse=True)]
+
+
+class SqlInstrumentationMiddleware:
+    """Число запросов, время SQL и повторяющиеся запросы на каждый запрос.
+
+    Пишет заголовок Server-Timing (персоналу, INTERNAL_IPS или всем при
+    SQL_INSTRUMENTATION_SERVER_TIMING) и выборочно логирует сводку в логгер anime.sql.
+    При SQL_INSTRUMENTATION_ENABLED = False middleware исключается из цепочки.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTATION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SQL_INSTRUMENTATION_SAMPLE_RATE', 0.01)
+        self.slow_ms = getattr(settings, 'SQL_INSTRUMENTATION_SLOW_MS', 500)
+        self.duplicate_threshold = getattr(settings, 'SQL_INSTRUMENTATION_DUPLICATE_THRESHOLD', 5)
+        self.slowest = getattr(settings, 'SQL_INSTRUMENTATION_SLOWEST', 5)
+        self.server_timing = getattr(settings, 'SQL_INSTRUMENTATION_SERVER_TIMING', settings.DEBUG)
+
+    def __call__(self, request):
+        stats = QueryStats(self.slowest)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+        sql_ms = stats.duration * 1000
+        if self.server_timing or self.is_internal(request):
+            response['Server-Timing'] = 'sql;dur={:.1f};desc="{} queries", app;dur={:.1f}'.format(
+                sql_ms, stats.count, total_ms)
+        sampled = self.sample_rate and random.random() < self.sample_rate
+        if sampled or total_ms >= self.slow_ms:
+            self.log(request, response, stats, sql_ms, total_ms)
+        return response
+
+    def is_internal(self, request):
+        # Тайминги раскрывают устройство бэкенда - только персоналу и адресам из INTERNAL_IPS
+        if request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS:
+            return True
+        user = getattr(request, 'user', None)
+        if user is None:
+            return False
+        # Без сессии пользователь анонимный; ленивый user не загружается ради заголовка (кешированные страницы)
+        loaded = getattr(user, '_wrapped', None) is not empty
+        if not loaded and settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return False
+        return user.is_staff
+
+    def log(self, request, response, stats, sql_ms, total_ms):
+        duplicates = stats.get_duplicates(self.duplicate_threshold)
+        payload = {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'sql_ms': round(sql_ms, 1),
+            'queries': stats.count,
+            'slowest': [{'ms': round(duration * 1000, 1), 'sql': sql[:500]} for duration, sql in stats.get_slowest()],
+            'duplicates': [{'count': count, 'sql': shape[:500]} for shape, count in duplicates],
+        }
+        level = logging.WARNING if duplicates or total_ms >= self.slow_ms else logging.INFO
+        logger.log(level, json.dumps(payload, ensure_ascii=False), extra={'sql_stats': payload})
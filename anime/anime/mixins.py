@@ -1,10 +1,17 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.views.generic.base import ContextMixin
 from django.views.generic.edit import FormMixin
 
-from .models import Comment
+from .models import Comment, AnimeListEntry
 from .forms import CommentForm
-from .utils import top_views, get_comments, get_random
+from .page_cache import get_content_version, get_page_cache, get_page_cache_key, get_page_etag, page_cache_enabled
+from .pagination import CursorPaginator, InvalidCursor
+from .sidebar import get_sidebar_context
+from .utils import get_random
 
 
 class ProfileContextMixin(ContextMixin):
@@ -15,24 +22,130 @@ class ProfileContextMixin(ContextMixin):
         return context
 
 
+class ProfileListMixin(ProfileContextMixin):
+    list_filter = {}
+
+    def get_list_entries(self):
+        return AnimeListEntry.objects.filter(profile=self.object, **self.list_filter).\
+            select_related('anime').order_by('-updated_date')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['entries'] = self.get_list_entries()
+        if self.request.user.is_authenticated and self.request.user.pk == self.object.user_id:
+            context['list_import'] = self.object.list_imports.order_by('-pk').first()
+        return context
+
+
 class CustomContextMixin(ProfileContextMixin, ContextMixin):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.user.is_authenticated:
             context['profile'] = self.request.user.profile
-        context['top_views'] = top_views()[:5]
-        context['last_comment'] = get_comments()[:4]
+        sidebar = get_sidebar_context()
+        context['top_views'] = sidebar['top_views']
+        context['last_comment'] = sidebar['last_comment']
         return context
 
 
-class CommentMixin(FormMixin):
+class AnonymousPageCacheMixin:
+
+    def get_page_cache_meta(self):
+        return {}
+
+    def page_cache_hit(self, meta):
+        pass
+
+    def set_page_cache_headers(self, response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated or not page_cache_enabled():
+            return super().dispatch(request, *args, **kwargs)
+        cache, timeout = get_page_cache()
+        version = get_content_version()
+        key = get_page_cache_key(request, version)
+        etag = get_page_etag(key)
+        entry = cache.get(key)
+        if entry is not None:
+            self.page_cache_hit(entry['meta'])
+        not_modified = get_conditional_response(request, etag=etag, last_modified=version)
+        if not_modified is not None:
+            return self.set_page_cache_headers(not_modified, etag, version)
+        if entry is not None:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            return self.set_page_cache_headers(response, etag, version)
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        cache.set(key, {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'meta': self.get_page_cache_meta(),
+        }, timeout)
+        return self.set_page_cache_headers(response, etag, version)
+
+
+class CursorPaginationMixin:
+    cursor_ordering = None
+
+    def paginate_queryset(self, queryset, page_size):
+        if 'page' in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Неверный курсор')
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['show_approximate_count'] = getattr(settings, 'CURSOR_PAGINATION_APPROXIMATE_COUNT', False)
+        return context
+
+
+class MemoizedObjectMixin:
+    """Кеширует get_object() на время запроса: экземпляр view создается заново для каждого запроса."""
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_memoized_object'):
+            self._memoized_object = super().get_object()
+        return self._memoized_object
+
+
+class CommentListMixin:
+    comments_paginate_by = None
+
+    def get_comments_for_anime(self):
+        return Comment.objects.filter(anime=self.get_object()).select_related('author', 'author__profile')
+
+    def get_comments_page(self, cursor=None):
+        per_page = self.comments_paginate_by or getattr(settings, 'COMMENTS_PAGE_SIZE', 20)
+        paginator = CursorPaginator(self.get_comments_for_anime(), per_page, ['-created_date'])
+        try:
+            return paginator.page(cursor)
+        except InvalidCursor:
+            raise Http404('Неверный курсор')
+
+
+class CommentMixin(CommentListMixin, FormMixin):
     form_class = CommentForm
 
     def get_success_url(self):
         return reverse_lazy('anime:anime_detail', kwargs={'slug': self.get_object().url})
 
     def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
         form = self.get_form()
         if form.is_valid():
             return self.form_valid(form)
@@ -40,12 +153,8 @@ class CommentMixin(FormMixin):
             return self.form_invalid(form)
 
     def form_valid(self, form):
-        self.object = form.save(commit=False)
-        self.object.author = self.request.user
-        self.object.anime = self.get_object()
-        self.object.save()
+        comment = form.save(commit=False)
+        comment.author = self.request.user
+        comment.anime = self.get_object()
+        comment.save()
         return super().form_valid(form)
-
-    def get_comments_for_anime(self):
-        return Comment.objects.filter(anime=self.get_object()).select_related('author')
-
@@ -1,6 +1,11 @@
+import os
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import FileSystemStorage
 from django.db import models
-from django.db.models import Avg
 from django.urls import reverse
 
 
@@ -38,12 +43,17 @@ class Studio(models.Model):
 
 
 class Ip(models.Model):
-    ip = models.CharField(max_length=100)
+    ip = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.ip
 
 
+def default_rating_score():
+    # Без оценок байесовский рейтинг равен априорному среднему (как в rebuild_ratings)
+    return getattr(settings, 'RATING_PRIOR_MEAN', 5)
+
+
 class Anime(models.Model):
     STATUS_ANIME = (
         ('released', 'Вышел'),
@@ -89,9 +99,30 @@ class Anime(models.Model):
     type = models.CharField('Тип', max_length=200, choices=TYPE_ANIME)
     views = models.ManyToManyField(Ip, verbose_name='Просмотры', related_name='anime_views', blank=True)
     url = models.SlugField(unique=True)
+    views_count = models.PositiveIntegerField('Кол-во просмотров', default=0, editable=False)
+    comments_count = models.PositiveIntegerField('Кол-во комментариев', default=0, editable=False)
+    ratings_count = models.PositiveIntegerField('Кол-во оценок', default=0, editable=False)
+    rating_sum = models.PositiveIntegerField('Сумма оценок', default=0, editable=False)
+    rating_score = models.FloatField('Взвешенный рейтинг', default=default_rating_score, editable=False, db_index=True)
+    trending_score = models.FloatField('Актуальность', default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['-views_count', '-comments_count', '-year'], name='anime_views_rank_idx'),
+            models.Index(fields=['-trending_score', '-views_count'], name='anime_trending_rank_idx'),
+            # Курсорная пагинация добавляет id в направлении последнего ключа сортировки
+            models.Index(fields=['-year', '-id'], name='anime_year_idx'),
+            models.Index(fields=['status', 'title', 'id'], name='anime_status_idx'),
+            models.Index(fields=['season', 'title', 'id'], name='anime_season_idx'),
+            models.Index(fields=['type', 'title', 'id'], name='anime_type_idx'),
+            models.Index(fields=['age_rating', 'title', 'id'], name='anime_age_rating_idx'),
+            # Поиск: @@ по search_vector и % (pg_trgm) по названиям
+            GinIndex(fields=['search_vector'], name='anime_search_vector_idx'),
+            GinIndex(OpClass('title', name='gin_trgm_ops'), name='anime_title_trgm_idx'),
+            GinIndex(OpClass('second_title', name='gin_trgm_ops'), name='anime_second_title_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -106,7 +137,50 @@ class Anime(models.Model):
         return self.related_series.all()
 
     def avg_rating(self):
-        return self.anime_rating.aggregate(Avg('star')).get('star__avg')
+        if self.ratings_count:
+            return self.rating_sum / self.ratings_count
+        return None
+
+
+class AnimeSimilarity(models.Model):
+    anime = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Аниме', related_name='similarities')
+    similar = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Похожее аниме', related_name='similar_to')
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['anime', 'similar'], name='unique_anime_similarity'),
+        ]
+        indexes = [
+            models.Index(fields=['anime', '-score'], name='similarity_anime_score_idx'),
+        ]
+
+    def __str__(self):
+        return '{} -> {}: {:.3f}'.format(self.anime_id, self.similar_id, self.score)
+
+
+class ActivityBucket(models.Model):
+    PERIOD_CHOICES = (
+        ('hour', 'Час'),
+        ('day', 'День'),
+    )
+
+    anime = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Аниме', related_name='activity')
+    period = models.CharField('Период', max_length=10, choices=PERIOD_CHOICES)
+    start = models.DateTimeField('Начало периода')
+    views = models.PositiveIntegerField('Просмотры', default=0)
+    comments = models.PositiveIntegerField('Комментарии', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['anime', 'period', 'start'], name='unique_activity_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'start'], name='activity_period_start_idx'),
+        ]
+
+    def __str__(self):
+        return '{}: {} {}'.format(self.anime_id, self.get_period_display(), self.start)
 
 
 class Profile(models.Model):
@@ -182,12 +256,93 @@ class Favorite(models.Model):
         return 'Аниме: {}'.format(self.anime)
 
 
+class AnimeListEntry(models.Model):
+    STATUS_CHOICES = (
+        ('watching', 'Смотрю'),
+        ('will_watch', 'Буду смотреть'),
+        ('viewed', 'Просмотрено'),
+        ('throw', 'Брошено'),
+    )
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, verbose_name='Профиль', related_name='list_entries')
+    anime = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Аниме', related_name='list_entries')
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, blank=True, null=True)
+    favorite = models.BooleanField('Любимое', default=False)
+    created_date = models.DateTimeField('Дата добавления', auto_now_add=True)
+    updated_date = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'anime'], name='unique_profile_anime_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', 'status', '-updated_date'], name='entry_profile_status_idx'),
+            models.Index(fields=['profile', 'favorite', '-updated_date'], name='entry_profile_favorite_idx'),
+        ]
+
+    def __str__(self):
+        return 'Аниме: {}, Статус: {}'.format(self.anime, self.get_status_display())
+
+
+class Recommendation(models.Model):
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, verbose_name='Профиль', related_name='recommendations')
+    anime = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Аниме', related_name='recommended_to')
+    score = models.FloatField('Оценка рекомендации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'anime'], name='unique_profile_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-score'], name='recommendation_profile_idx'),
+        ]
+
+    def __str__(self):
+        return '{}: {}'.format(self.profile, self.anime)
+
+
+# Загруженные файлы импорта не должны быть доступны через MEDIA_URL
+private_storage = FileSystemStorage(location=getattr(settings, 'PRIVATE_MEDIA_ROOT', None))
+
+
+class ListImport(models.Model):
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('xml', 'MyAnimeList XML'),
+    )
+
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    )
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, verbose_name='Профиль', related_name='list_imports')
+    file = models.FileField('Файл', upload_to='list_imports/', storage=private_storage)
+    format = models.CharField('Формат', max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='pending')
+    processed = models.PositiveIntegerField('Обработано строк', default=0)
+    matched = models.PositiveIntegerField('Найдено аниме', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created_date = models.DateTimeField('Дата загрузки', auto_now_add=True)
+    finished_date = models.DateTimeField('Дата завершения', blank=True, null=True)
+
+    def __str__(self):
+        return 'Импорт списка: {}, {}'.format(self.profile, self.get_status_display())
+
+
 class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Автор')
     anime = models.ForeignKey(Anime, on_delete=models.CASCADE, related_name='comments', null=True)
     text = models.TextField('Текст', max_length=500)
     created_date = models.DateTimeField('Дата создания', auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['anime', '-created_date'], name='comment_anime_created_idx'),
+        ]
+
     def __str__(self):
         return 'Комментарий: {}'.format(self.anime)
 
@@ -210,16 +365,32 @@ class Rating(models.Model):
     star = models.ForeignKey(RatingStar, on_delete=models.CASCADE, verbose_name='Звезды')
     anime = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Аниме', related_name='anime_rating')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'anime'], name='unique_profile_anime_rating'),
+        ]
+
     def __str__(self):
         return '{}, Звезда: {}, Аниме: {}'.format(self.profile, self.star, self.anime)
 
 
 class Video(models.Model):
+    HLS_STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('processing', 'Обрабатывается'),
+        ('ready', 'Готово'),
+        ('failed', 'Ошибка'),
+    )
+
     name = models.CharField(max_length=100)
     video = models.FileField(upload_to='video/')
-    thumb = models.FileField(upload_to='thumb/')
+    thumb = models.FileField(upload_to='thumb/', blank=True)
     anime = models.ForeignKey(Anime, on_delete=models.CASCADE, related_name='related_series')
     url = models.SlugField(unique=True, null=True)
+    hls_status = models.CharField('Статус HLS', max_length=20, choices=HLS_STATUS_CHOICES, default='pending', editable=False)
+    hls_playlist = models.CharField('HLS плейлист', max_length=255, blank=True, editable=False)
+    hls_source = models.CharField('Исходник HLS', max_length=255, blank=True, editable=False)
+    duration = models.FloatField('Длительность', null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -227,6 +398,16 @@ class Video(models.Model):
     def get_absolute_url(self):
         return reverse('anime:anime_video', kwargs={'series': self.anime.url, 'slug': self.url})
 
+    def get_stream_url(self):
+        return reverse('anime:anime_video_stream', kwargs={'series': self.anime.url, 'slug': self.url})
+
+    def get_hls_url(self):
+        if self.hls_status == 'ready' and self.hls_playlist:
+            return reverse('anime:anime_video_hls', kwargs={
+                'series': self.anime.url, 'slug': self.url, 'name': os.path.basename(self.hls_playlist),
+            })
+        return None
+
 
 class AnimeShot(models.Model):
     anime = models.ForeignKey(Anime, on_delete=models.CASCADE, verbose_name='Аниме', related_name='anime_shots')
@@ -235,3 +416,8 @@ class AnimeShot(models.Model):
     def __str__(self):
         return 'Кадр: {}'.format(self.anime.title)
 
+
+class ContentVersion(models.Model):
+    """Версия контента для кеша страниц и ETag, одна строка. Нужна, когда общего кеша нет
+    и у каждого процесса свой LocMemCache - версия в нем не видна другим процессам."""
+    version = models.BigIntegerField('Версия', default=0)
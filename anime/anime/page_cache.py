@@ -0,0 +1,68 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .caching import select_cache
+from .models import ContentVersion
+
+CONTENT_VERSION_KEY = 'anime:content-version'
+
+CONTENT_VERSION_PK = 1
+
+
+def get_page_cache():
+    return select_cache('PAGE_CACHE_ALIAS', 'PAGE_CACHE_TIMEOUT', 'PAGE_LOCAL_CACHE_TIMEOUT', 600, 30)
+
+
+def page_cache_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', True)
+
+
+def _read_db_version():
+    version = ContentVersion.objects.filter(pk=CONTENT_VERSION_PK).values_list('version', flat=True).first()
+    if version is None:
+        ContentVersion.objects.get_or_create(pk=CONTENT_VERSION_PK, defaults={'version': int(time.time())})
+        version = ContentVersion.objects.filter(pk=CONTENT_VERSION_PK).values_list('version', flat=True).first()
+    return version
+
+
+def get_content_version():
+    cache, timeout = get_page_cache()
+    version = cache.get(CONTENT_VERSION_KEY)
+    if version is not None:
+        return version
+    if isinstance(cache, LocMemCache):
+        # Кеш процесса: версия берется из БД и держится не дольше локального таймаута,
+        # чтобы смена версии в другом процессе была видна здесь
+        version = _read_db_version()
+        cache.set(CONTENT_VERSION_KEY, version, timeout)
+        return version
+    cache.add(CONTENT_VERSION_KEY, int(time.time()), None)
+    return cache.get(CONTENT_VERSION_KEY)
+
+
+def bump_content_version():
+    cache, timeout = get_page_cache()
+    version = int(time.time())
+    if isinstance(cache, LocMemCache):
+        updated = ContentVersion.objects.filter(pk=CONTENT_VERSION_PK).update(
+            version=Greatest(F('version') + 1, Value(version)))
+        if not updated:
+            ContentVersion.objects.get_or_create(pk=CONTENT_VERSION_PK, defaults={'version': version})
+        cache.delete(CONTENT_VERSION_KEY)
+        return
+    current = cache.get(CONTENT_VERSION_KEY) or 0
+    cache.set(CONTENT_VERSION_KEY, max(version, current + 1), None)
+
+
+def get_page_cache_key(request, version):
+    digest = hashlib.md5(f'{request.get_host()}{request.get_full_path()}'.encode()).hexdigest()
+    return f'anime:page:{version}:{digest}'
+
+
+def get_page_etag(key):
+    return '"{}"'.format(hashlib.md5(key.encode()).hexdigest())
@@ -0,0 +1,141 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder обрезает время до миллисекунд - в курсоре нужна полная точность."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1], 'next')
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], 'prev')
+        return None
+
+
+class CursorPaginator:
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = self.get_ordering(ordering)
+        self.fields = [queryset.model._meta.get_field(name) for name, descending in self.ordering]
+
+    def get_ordering(self, ordering):
+        ordering = list(ordering or self.queryset.query.order_by or self.queryset.model._meta.ordering)
+        pk_name = self.queryset.model._meta.pk.name
+        result = []
+        for item in ordering:
+            if not isinstance(item, str) or '__' in item or item.lstrip('-') == '?':
+                raise ValueError(f'Unsupported cursor ordering: {item!r}')
+            name = item.lstrip('-')
+            result.append((pk_name if name == 'pk' else name, item.startswith('-')))
+        if pk_name not in [name for name, descending in result]:
+            result.append((pk_name, result[-1][1] if result else False))
+        return result
+
+    def order_by(self, reverse=False):
+        return [('-' if descending != reverse else '') + name for name, descending in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        if isinstance(obj, dict):
+            values = [obj[field.attname] for field in self.fields]
+        else:
+            values = [getattr(obj, field.attname) for field in self.fields]
+        payload = json.dumps({'v': values, 'd': direction}, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = [field.to_python(value) for field, value in zip(self.fields, payload['v'])]
+            direction = payload['d']
+        except (ValueError, TypeError, KeyError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+        if len(values) != len(self.fields) or direction not in ('next', 'prev'):
+            raise InvalidCursor(cursor)
+        return values, direction
+
+    def keyset_filter(self, values, reverse):
+        condition = Q()
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {field_name: value for (field_name, _), value in zip(self.ordering[:index], values[:index])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[index]})
+        return condition
+
+    def page(self, cursor=None):
+        if not cursor:
+            rows = list(self.queryset.order_by(*self.order_by())[:self.per_page + 1])
+            return CursorPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+        values, direction = self.decode_cursor(cursor)
+        reverse = direction == 'prev'
+        queryset = self.queryset.filter(self.keyset_filter(values, reverse)).order_by(*self.order_by(reverse))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            return CursorPage(rows, self, True, has_more)
+        return CursorPage(rows, self, has_more, True)
+
+    @property
+    def approximate_count(self):
+        connection = connections[self.queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = self.queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
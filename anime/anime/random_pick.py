@@ -0,0 +1,51 @@
+import random
+from array import array
+
+from .indexes import InMemoryIndex
+from .models import Anime
+
+
+class RandomAnimePicker(InMemoryIndex):
+    refresh_interval_setting = 'RANDOM_ANIME_REFRESH_INTERVAL'
+    filter_fields = ('status', 'type', 'season', 'age_rating')
+
+    def load(self):
+        rows = Anime.objects.order_by('pk').values_list('pk', 'url', *self.filter_fields)
+        ids = array('q')
+        urls = []
+        groups = {}
+        for position, row in enumerate(rows):
+            ids.append(row[0])
+            urls.append(row[1])
+            for field, value in zip(self.filter_fields, row[2:]):
+                groups.setdefault((field, value), array('l')).append(position)
+        return ids, urls, groups
+
+    def get_positions(self, filters):
+        ids, urls, groups = self.get()
+        if not filters:
+            return range(len(ids))
+        positions = None
+        for field, value in filters.items():
+            if field not in self.filter_fields:
+                raise ValueError(f'Unsupported filter: {field}')
+            group = set(groups.get((field, value), ()))
+            positions = group if positions is None else positions & group
+        return sorted(positions)
+
+    def make_instance(self, position):
+        ids, urls, groups = self.get()
+        return Anime.from_db(None, ['id', 'url'], [ids[position], urls[position]])
+
+    def pick(self, **filters):
+        positions = self.get_positions(filters)
+        if not positions:
+            return None
+        return self.make_instance(random.choice(positions))
+
+    def sample(self, count, **filters):
+        positions = self.get_positions(filters)
+        return [self.make_instance(position) for position in random.sample(positions, min(count, len(positions)))]
+
+
+random_picker = RandomAnimePicker()
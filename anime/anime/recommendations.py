@@ -0,0 +1,113 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from scipy import sparse
+
+from .models import AnimeListEntry, Rating, RatingStar, Recommendation
+
+STATUS_WEIGHTS = {
+    'watching': 0.8,
+    'will_watch': 0.5,
+    'viewed': 1.0,
+    'throw': -1.0,
+}
+
+FAVORITE_WEIGHT = 1.5
+
+RATING_WEIGHT = 2.0
+
+
+def get_top_n():
+    return getattr(settings, 'RECOMMENDATIONS_TOP_N', 30)
+
+
+def get_neighbours():
+    return getattr(settings, 'RECOMMENDATIONS_NEIGHBOURS', 50)
+
+
+def load_interactions():
+    interactions = {}
+
+    def add(profile_id, anime_id, weight):
+        key = (profile_id, anime_id)
+        interactions[key] = interactions.get(key, 0.0) + weight
+
+    max_star = RatingStar.objects.aggregate(value=Max('value'))['value'] or 1
+    for profile_id, anime_id, value in Rating.objects.values_list('profile_id', 'anime_id', 'star__value').iterator():
+        add(profile_id, anime_id, RATING_WEIGHT * value / max_star)
+    entries = AnimeListEntry.objects.values_list('profile_id', 'anime_id', 'status', 'favorite')
+    for profile_id, anime_id, status, favorite in entries.iterator():
+        add(profile_id, anime_id, STATUS_WEIGHTS.get(status, 0.0) + (FAVORITE_WEIGHT if favorite else 0.0))
+    return interactions
+
+
+def build_matrix(interactions):
+    profiles = sorted({profile_id for profile_id, anime_id in interactions})
+    items = sorted({anime_id for profile_id, anime_id in interactions})
+    profile_index = {pk: index for index, pk in enumerate(profiles)}
+    item_index = {pk: index for index, pk in enumerate(items)}
+    rows = np.fromiter((profile_index[key[0]] for key in interactions), dtype=np.int64, count=len(interactions))
+    cols = np.fromiter((item_index[key[1]] for key in interactions), dtype=np.int64, count=len(interactions))
+    data = np.fromiter(interactions.values(), dtype=np.float32, count=len(interactions))
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(profiles), len(items)))
+    return np.array(profiles), np.array(items), matrix
+
+
+def item_similarity(matrix, neighbours):
+    positive = matrix.maximum(0).tocsc()
+    norms = np.sqrt(np.asarray(positive.multiply(positive).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = positive @ sparse.diags(1.0 / norms)
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    pruned_rows, pruned_cols, pruned_data = [], [], []
+    for item in range(similarity.shape[0]):
+        start, end = similarity.indptr[item], similarity.indptr[item + 1]
+        cols, data = similarity.indices[start:end], similarity.data[start:end]
+        if len(data) > neighbours:
+            best = np.argpartition(-data, neighbours - 1)[:neighbours]
+            cols, data = cols[best], data[best]
+        pruned_rows.append(np.full(len(cols), item, dtype=np.int64))
+        pruned_cols.append(cols)
+        pruned_data.append(data)
+    if not pruned_rows:
+        return similarity
+    return sparse.csr_matrix(
+        (np.concatenate(pruned_data), (np.concatenate(pruned_rows), np.concatenate(pruned_cols))),
+        shape=similarity.shape,
+    )
+
+
+def build_recommendations(top_n=None, batch_size=1000):
+    top_n = top_n or get_top_n()
+    interactions = load_interactions()
+    objects = []
+    if interactions:
+        profiles, items, matrix = build_matrix(interactions)
+        similarity = item_similarity(matrix, get_neighbours()).astype(np.float32)
+        for start in range(0, len(profiles), batch_size):
+            block = matrix[start:start + batch_size]
+            # Оценки остаются разреженными: плотный блок профили x каталог не помещается в память
+            scores = (block.maximum(0) @ similarity).tocsr()
+            scores = (scores - scores.multiply(block != 0)).tocsr()
+            scores.eliminate_zeros()
+            for offset in range(scores.shape[0]):
+                begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+                cols, data = scores.indices[begin:end], scores.data[begin:end]
+                positive = data > 0
+                cols, data = cols[positive], data[positive]
+                if len(data) > top_n:
+                    best = np.argpartition(-data, top_n - 1)[:top_n]
+                    cols, data = cols[best], data[best]
+                for item, score in zip(cols, data):
+                    objects.append(Recommendation(
+                        profile_id=int(profiles[start + offset]),
+                        anime_id=int(items[item]),
+                        score=float(score),
+                    ))
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        Recommendation.objects.bulk_create(objects, batch_size=1000)
+    return len(objects)
@@ -0,0 +1,174 @@
+import math
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection, connections
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .indexes import InMemoryIndex
+from .models import Anime
+
+SEARCH_CONFIGS = ('russian', 'english')
+
+SEARCH_FIELDS = (
+    ('title', 'A', 1.0),
+    ('second_title', 'B', 0.4),
+    ('description', 'C', 0.2),
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_search_backend():
+    backend = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'postgres' if connection.vendor == 'postgresql' else 'memory'
+    return backend
+
+
+# Порог оператора % (pg_trgm.similarity_threshold) по умолчанию
+PG_TRGM_THRESHOLD = 0.3
+
+
+def get_trigram_threshold():
+    return getattr(settings, 'SEARCH_TRIGRAM_THRESHOLD', PG_TRGM_THRESHOLD)
+
+
+def create_trigram_extension(using):
+    # GIN-индексы gin_trgm_ops из Anime.Meta создаются миграцией - расширение нужно до нее
+    db_connection = connections[using]
+    if db_connection.vendor == 'postgresql':
+        with db_connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def set_trigram_threshold(db_connection):
+    # Запрос на каждое соединение - только если порог отличается от значения pg_trgm
+    threshold = get_trigram_threshold()
+    if db_connection.vendor == 'postgresql' and threshold != PG_TRGM_THRESHOLD:
+        with db_connection.cursor() as cursor:
+            cursor.execute('SET pg_trgm.similarity_threshold = %s', [threshold])
+
+
+def build_search_vector():
+    vector = None
+    for field, weight, boost in SEARCH_FIELDS:
+        for config in SEARCH_CONFIGS:
+            part = SearchVector(Coalesce(field, Value('')), weight=weight, config=config)
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vector(anime_ids=None):
+    if get_search_backend() != 'postgres':
+        search_index.invalidate()
+        return
+    queryset = Anime.objects.all()
+    if anime_ids is not None:
+        queryset = queryset.filter(pk__in=anime_ids)
+    queryset.update(search_vector=build_search_vector())
+
+
+def tokenize(text):
+    return [token.casefold() for token in TOKEN_RE.findall(text or '')]
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex(InMemoryIndex):
+    refresh_interval_setting = 'SEARCH_INDEX_REFRESH_INTERVAL'
+
+    def load(self):
+        postings = defaultdict(dict)
+        popularity = {}
+        fields = [field for field, weight, boost in SEARCH_FIELDS]
+        for row in Anime.objects.order_by().values('pk', 'views_count', *fields).iterator():
+            popularity[row['pk']] = row['views_count']
+            for field, weight, boost in SEARCH_FIELDS:
+                for token in tokenize(row[field]):
+                    postings[token][row['pk']] = postings[token].get(row['pk'], 0) + boost
+        vocabulary = defaultdict(set)
+        for token in postings:
+            for trigram in trigrams(token):
+                vocabulary[trigram].add(token)
+        return dict(postings), dict(vocabulary), popularity
+
+    def similar_tokens(self, token):
+        postings, vocabulary, popularity = self.get()
+        if token in postings:
+            return {token: 1.0}
+        query_trigrams = trigrams(token)
+        candidates = set()
+        for trigram in query_trigrams:
+            candidates |= vocabulary.get(trigram, set())
+        threshold = get_trigram_threshold()
+        similar = {}
+        for candidate in candidates:
+            candidate_trigrams = trigrams(candidate)
+            similarity = len(query_trigrams & candidate_trigrams) / len(query_trigrams | candidate_trigrams)
+            if similarity >= threshold:
+                similar[candidate] = similarity
+        return similar
+
+    def search(self, query):
+        postings, vocabulary, popularity = self.get()
+        scores = defaultdict(float)
+        for token in tokenize(query):
+            matched = defaultdict(float)
+            for candidate, similarity in self.similar_tokens(token).items():
+                idf = math.log(1 + len(popularity) / len(postings[candidate]))
+                for anime_id, weight in postings[candidate].items():
+                    matched[anime_id] = max(matched[anime_id], weight * similarity * idf)
+            for anime_id, score in matched.items():
+                scores[anime_id] += score
+        return sorted(scores, key=lambda anime_id: (-scores[anime_id], -popularity[anime_id], anime_id))
+
+
+class RankedResults:
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.ids[index]
+            anime = Anime.objects.in_bulk(ids)
+            return [anime[pk] for pk in ids if pk in anime]
+        return self[index:index + 1][0]
+
+
+def search_anime(query):
+    query = (query or '').strip()
+    if not query:
+        return Anime.objects.none()
+    if get_search_backend() != 'postgres':
+        return RankedResults(search_index.search(query))
+    search_query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(query, config=config, search_type='websearch')
+        search_query = part if search_query is None else search_query | part
+    # Фильтр - операторы @@ и %, которые идут по GIN-индексам; similarity только для ранжирования
+    return Anime.objects.filter(
+        Q(search_vector=search_query) | Q(title__trigram_similar=query) | Q(second_title__trigram_similar=query)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query),
+        similarity=Greatest(
+            TrigramSimilarity('title', query),
+            TrigramSimilarity(Coalesce('second_title', Value('')), query),
+        ),
+    ).order_by('-rank', '-similarity', '-views_count', 'id')
+
+
+search_index = InvertedIndex()
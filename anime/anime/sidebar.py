@@ -0,0 +1,29 @@
+from .caching import select_cache
+from .utils import top_views, get_recently_discussed
+
+SIDEBAR_CACHE_KEY = 'anime:sidebar'
+
+
+def get_sidebar_cache():
+    return select_cache('SIDEBAR_CACHE_ALIAS', 'SIDEBAR_CACHE_TIMEOUT', 'SIDEBAR_LOCAL_CACHE_TIMEOUT')
+
+
+def build_sidebar_context():
+    return {
+        'top_views': list(top_views()[:5]),
+        'last_comment': list(get_recently_discussed()[:4]),
+    }
+
+
+def get_sidebar_context():
+    cache, timeout = get_sidebar_cache()
+    context = cache.get(SIDEBAR_CACHE_KEY)
+    if context is None:
+        context = build_sidebar_context()
+        cache.set(SIDEBAR_CACHE_KEY, context, timeout)
+    return context
+
+
+def invalidate_sidebar():
+    cache, timeout = get_sidebar_cache()
+    cache.delete(SIDEBAR_CACHE_KEY)
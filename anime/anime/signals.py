@@ -1,8 +1,20 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed, pre_migrate
 from django.dispatch import receiver
 
-from .models import AnimeList, Profile
+from .facets import facet_index
+from .images import schedule_derivatives
+from .page_cache import bump_content_version
+from .transcoding import schedule_packaging, remove_hls
+from .models import AnimeList, Profile, Anime, AnimeSimilarity, Comment, Rating, Genre, Directors, Studio, Video, AnimeShot
+from .random_pick import random_picker
+from .search import create_trigram_extension, search_index, set_trigram_threshold, update_search_vector
+from .similarity import schedule_similarity_refresh
+from .trending import record_activity
+from .sidebar import invalidate_sidebar
+from .utils import adjust_counter, refresh_rating_aggregates
 
 
 @receiver(post_save, sender=User)
@@ -11,7 +23,194 @@ def create_profile_and_anime_list(sender, instance, created, **kwargs):
         profile = Profile.objects.create(
             user=instance
         )
-        anime_list = AnimeList.objects.create(
+        # Старый AnimeList создается, пока его модели не удалены (см. migrate_anime_lists)
+        AnimeList.objects.create(
             owner=profile
         )
 
+
+@receiver(m2m_changed, sender=Anime.views.through)
+def update_views_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_anime_ids = list(instance.anime_views.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        delta = len(pk_set) if action == 'post_add' else -len(pk_set)
+        if reverse:
+            adjust_counter(pk_set, 'views_count', 1 if delta > 0 else -1)
+        else:
+            adjust_counter([instance.pk], 'views_count', delta)
+    elif action == 'post_clear':
+        if reverse:
+            adjust_counter(getattr(instance, '_cleared_anime_ids', []), 'views_count', -1)
+        else:
+            Anime.objects.filter(pk=instance.pk).update(views_count=0)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created and instance.anime_id:
+        adjust_counter([instance.anime_id], 'comments_count', 1)
+        record_activity(comments={instance.anime_id: 1})
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    if instance.anime_id:
+        adjust_counter([instance.anime_id], 'comments_count', -1)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def refresh_rating_on_change(sender, instance, **kwargs):
+    # Пересчет по таблице оценок: одинаково для rate_anime, админки, shell и фикстур
+    refresh_rating_aggregates(instance.anime_id)
+
+
+@receiver(post_save, sender=Anime)
+@receiver(post_delete, sender=Anime)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_sidebar_on_change(sender, **kwargs):
+    invalidate_sidebar()
+
+
+@receiver(m2m_changed, sender=Anime.views.through)
+def invalidate_sidebar_on_views_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_sidebar()
+
+
+@receiver(post_save, sender=Anime)
+@receiver(post_delete, sender=Anime)
+def invalidate_random_picker(sender, **kwargs):
+    random_picker.invalidate()
+
+
+@receiver(post_save, sender=Anime)
+def update_anime_search_vector(sender, instance, **kwargs):
+    update_search_vector([instance.pk])
+
+
+@receiver(post_delete, sender=Anime)
+def invalidate_search_index(sender, instance, **kwargs):
+    search_index.invalidate()
+
+
+@receiver(post_save, sender=Anime)
+@receiver(post_delete, sender=Anime)
+def update_facet_index(sender, instance, **kwargs):
+    facet_index.update_anime(instance.pk)
+
+
+@receiver(m2m_changed, sender=Anime.genre.through)
+@receiver(m2m_changed, sender=Anime.directors.through)
+def update_facet_index_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        facet_index.update_anime(instance.pk)
+    elif pk_set:
+        for anime_id in pk_set:
+            facet_index.update_anime(anime_id)
+    else:
+        facet_index.invalidate()
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Directors)
+@receiver(post_delete, sender=Directors)
+@receiver(post_save, sender=Studio)
+@receiver(post_delete, sender=Studio)
+def invalidate_facet_index(sender, **kwargs):
+    facet_index.invalidate()
+
+
+@receiver(post_save, sender=Anime)
+def refresh_similarity_on_save(sender, instance, **kwargs):
+    schedule_similarity_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Anime)
+def remember_similar_anime(sender, instance, **kwargs):
+    # Строки AnimeSimilarity удаляются каскадом - соседей нужно запомнить до этого
+    instance._similar_anime_ids = list(
+        AnimeSimilarity.objects.filter(similar=instance).values_list('anime_id', flat=True))
+
+
+@receiver(post_delete, sender=Anime)
+def refresh_similarity_on_delete(sender, instance, **kwargs):
+    # Удаленное аниме убирается из матрицы, его соседи добирают список до SIMILARITY_TOP_K
+    schedule_similarity_refresh([instance.pk, *getattr(instance, '_similar_anime_ids', ())])
+
+
+@receiver(m2m_changed, sender=Anime.genre.through)
+@receiver(m2m_changed, sender=Anime.directors.through)
+def refresh_similarity_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_similarity_refresh([instance.pk])
+    elif pk_set:
+        schedule_similarity_refresh(pk_set)
+
+
+@receiver(post_save, sender=Anime)
+@receiver(post_delete, sender=Anime)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=AnimeShot)
+@receiver(post_delete, sender=AnimeShot)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Directors)
+@receiver(post_save, sender=Studio)
+def bump_page_cache_version(sender, **kwargs):
+    bump_content_version()
+
+
+@receiver(m2m_changed, sender=Anime.genre.through)
+@receiver(m2m_changed, sender=Anime.directors.through)
+def bump_page_cache_version_on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_content_version()
+
+
+@receiver(post_save, sender=Video)
+def package_video_on_save(sender, instance, **kwargs):
+    schedule_packaging(instance)
+
+
+@receiver(post_delete, sender=Video)
+def remove_video_hls(sender, instance, **kwargs):
+    video_id = instance.pk
+    transaction.on_commit(lambda: remove_hls(video_id))
+
+
+@receiver(post_save, sender=Anime)
+def build_poster_derivatives(sender, instance, **kwargs):
+    schedule_derivatives(instance.poster, 'poster')
+
+
+@receiver(post_save, sender=Profile)
+def build_avatar_derivatives(sender, instance, **kwargs):
+    schedule_derivatives(instance.avatar, 'avatar')
+
+
+@receiver(post_save, sender=AnimeShot)
+def build_shot_derivatives(sender, instance, **kwargs):
+    schedule_derivatives(instance.shot, 'shot')
+
+
+@receiver(pre_migrate)
+def prepare_search_extensions(sender, using, **kwargs):
+    if sender.name == 'anime':
+        create_trigram_extension(using)
+
+
+@receiver(connection_created)
+def configure_search_connection(sender, connection, **kwargs):
+    set_trigram_threshold(connection)
@@ -0,0 +1,209 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+from .indexes import InMemoryIndex
+from .models import Anime, AnimeSimilarity
+from .page_cache import bump_content_version
+from .workers import submit
+
+FEATURE_WEIGHTS = {
+    'genre': 3.0,
+    'directors': 2.0,
+    'studio': 1.5,
+    'type': 1.0,
+    'year': 0.5,
+}
+
+YEAR_BUCKET = 5
+
+_queued = set()
+_queued_lock = threading.Lock()
+_job_queued = False
+
+
+def get_top_k():
+    return getattr(settings, 'SIMILARITY_TOP_K', 12)
+
+
+def load_anime_features(anime_ids=None):
+    """Признаки аниме: {pk: set((имя, значение))}; удаленных аниме в результате нет."""
+    queryset = Anime.objects.order_by()
+    if anime_ids is not None:
+        queryset = queryset.filter(pk__in=anime_ids)
+    features = {}
+    for pk, studio_id, type_, year in queryset.values_list('pk', 'studio_id', 'type', 'year').iterator():
+        features[pk] = {('studio', studio_id), ('type', type_), ('year', year.year // YEAR_BUCKET)}
+    for name in ('genre', 'directors'):
+        through = getattr(Anime, name).through.objects.values_list('anime_id', f'{name}_id')
+        if anime_ids is not None:
+            through = through.filter(anime_id__in=anime_ids)
+        for anime_id, value in through.iterator():
+            if anime_id in features:
+                features[anime_id].add((name, value))
+    return features
+
+
+def build_matrix(feature_sets, columns):
+    """Нормированные строки признаков; новые признаки добавляются в columns."""
+    cells = set()
+    for position, features in enumerate(feature_sets):
+        for feature in features:
+            cells.add((position, columns.setdefault(feature, len(columns))))
+    weights = np.sqrt(np.array([FEATURE_WEIGHTS[feature[0]] for feature in columns], dtype=np.float32))
+    rows_index = np.fromiter((position for position, column in cells), dtype=np.int64, count=len(cells))
+    cols_index = np.fromiter((column for position, column in cells), dtype=np.int64, count=len(cells))
+    matrix = sparse.csr_matrix((weights[cols_index], (rows_index, cols_index)),
+                               shape=(len(feature_sets), len(columns)))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return (sparse.diags(1.0 / norms) @ matrix).tocsr()
+
+
+class FeatureIndex(InMemoryIndex):
+    """Матрица признаков каталога в памяти процесса.
+
+    При правке аниме из базы читаются только его признаки и заменяются его строки,
+    удаленные аниме остаются нулевыми строками до следующей полной загрузки.
+    """
+    refresh_interval_setting = 'SIMILARITY_FEATURES_REFRESH_INTERVAL'
+
+    def load(self):
+        features = load_anime_features()
+        ids = sorted(features)
+        columns = {}
+        return {
+            'ids': np.array(ids, dtype=np.int64),
+            'positions': {pk: position for position, pk in enumerate(ids)},
+            'columns': columns,
+            'matrix': build_matrix([features[pk] for pk in ids], columns),
+        }
+
+    def update(self, anime_ids):
+        data = self.get()
+        with self._lock:
+            features = load_anime_features(anime_ids)
+            columns = dict(data['columns'])
+            positions = dict(data['positions'])
+            new = sorted(pk for pk in features if pk not in positions)
+            positions.update((pk, len(data['ids']) + offset) for offset, pk in enumerate(new))
+            ids = np.concatenate([data['ids'], np.array(new, dtype=np.int64)])
+
+            changed = sorted(pk for pk in anime_ids if pk in positions)
+            rows = np.array([positions[pk] for pk in changed], dtype=np.int64)
+            patch = build_matrix([features.get(pk, ()) for pk in changed], columns).tocoo()
+            old = data['matrix'].tocoo()
+            keep = ~np.isin(old.row, rows)
+            matrix = sparse.csr_matrix(
+                (np.concatenate([old.data[keep], patch.data]),
+                 (np.concatenate([old.row[keep], rows[patch.row]]), np.concatenate([old.col[keep], patch.col]))),
+                shape=(len(ids), len(columns)),
+            )
+            for pk in changed:
+                if pk not in features:
+                    positions.pop(pk)
+            self._data = {'ids': ids, 'positions': positions, 'columns': columns, 'matrix': matrix}
+            return self._data
+
+
+def top_neighbours(matrix, rows, top_k):
+    scores = (matrix[rows] @ matrix.T).toarray()
+    scores[np.arange(len(rows)), rows] = -1.0
+    k = min(top_k, matrix.shape[0] - 1)
+    if k <= 0:
+        return np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0), dtype=np.float32)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def build_rows(ids, matrix, rows, top_k):
+    objects = []
+    neighbours, scores = top_neighbours(matrix, rows, top_k)
+    for row, row_neighbours, row_scores in zip(rows, neighbours, scores):
+        for neighbour, score in zip(row_neighbours, row_scores):
+            if score > 0:
+                objects.append(AnimeSimilarity(anime_id=int(ids[row]), similar_id=int(ids[neighbour]), score=float(score)))
+    return objects
+
+
+def build_similarity(batch_size=500, top_k=None):
+    top_k = top_k or get_top_k()
+    feature_index.invalidate()
+    data = feature_index.get()
+    ids, matrix = data['ids'], data['matrix']
+    objects = []
+    for start in range(0, len(ids), batch_size):
+        objects.extend(build_rows(ids, matrix, np.arange(start, min(start + batch_size, len(ids))), top_k))
+    with transaction.atomic():
+        AnimeSimilarity.objects.all().delete()
+        AnimeSimilarity.objects.bulk_create(objects, batch_size=1000)
+    return len(objects)
+
+
+def refresh_similarity(anime_ids):
+    top_k = get_top_k()
+    data = feature_index.update(anime_ids)
+    ids, positions, matrix = data['ids'], data['positions'], data['matrix']
+    changed = [positions[pk] for pk in anime_ids if pk in positions]
+    affected = set(AnimeSimilarity.objects.filter(similar_id__in=anime_ids).values_list('anime_id', flat=True))
+    if changed:
+        stats = AnimeSimilarity.objects.values('anime_id').annotate(score=Min('score'), cnt=Count('id'))
+        minimum = np.zeros(len(ids), dtype=np.float32)
+        full = np.zeros(len(ids), dtype=bool)
+        for row in stats:
+            position = positions.get(row['anime_id'])
+            if position is not None:
+                minimum[position] = row['score']
+                full[position] = row['cnt'] >= top_k
+        for start in range(0, len(changed), 500):
+            for row_scores in (matrix[changed[start:start + 500]] @ matrix.T).toarray():
+                candidates = np.nonzero((row_scores > 0) & (~full | (row_scores > minimum)))[0]
+                affected.update(ids[candidates].tolist())
+    affected.update(anime_ids)
+    rows = np.array(sorted(positions[pk] for pk in affected if pk in positions), dtype=np.int64)
+    objects = []
+    for start in range(0, len(rows), 500):
+        objects.extend(build_rows(ids, matrix, rows[start:start + 500], top_k))
+    with transaction.atomic():
+        AnimeSimilarity.objects.filter(anime_id__in=affected).delete()
+        AnimeSimilarity.objects.bulk_create(objects, batch_size=1000)
+
+
+def _run_queued_refresh():
+    global _job_queued
+    with _queued_lock:
+        anime_ids = set(_queued)
+        _queued.clear()
+        _job_queued = False
+    if anime_ids:
+        refresh_similarity(anime_ids)
+        # Блок "Похожие" в кеше страниц собран до фонового пересчета
+        bump_content_version()
+
+
+def _enqueue_refresh(anime_ids):
+    # Пока задача ждет в пуле, новые id добавляются к ней, а не ставят еще одну
+    global _job_queued
+    with _queued_lock:
+        _queued.update(anime_ids)
+        if _job_queued:
+            return
+        _job_queued = True
+    submit('similarity', 'SIMILARITY_WORKERS', _run_queued_refresh)
+
+
+feature_index = FeatureIndex()
+
+
+def schedule_similarity_refresh(anime_ids):
+    """Пересчет в фоне после commit; при откате транзакции колбэк отбрасывается вместе с id."""
+    if not getattr(settings, 'SIMILARITY_AUTO_REFRESH', True):
+        return
+    anime_ids = set(anime_ids)
+    transaction.on_commit(lambda: _enqueue_refresh(anime_ids))
@@ -0,0 +1,12 @@
+// Load more comments
+document.addEventListener("click", function (e) {
+    const button = e.target.closest('.comments-more');
+    if (!button) {
+        return;
+    }
+    button.disabled = true;
+    fetch(button.dataset.url)
+        .then(response => response.text())
+        .then(html => button.outerHTML = html)
+        .catch(error => button.disabled = false)
+});
@@ -0,0 +1,21 @@
+// Poll list import status
+const importStatus = document.getElementById('list-import-status');
+
+function pollImport() {
+    if (importStatus.dataset.status === 'done' || importStatus.dataset.status === 'failed') {
+        return;
+    }
+    fetch(importStatus.dataset.url)
+        .then(response => response.json())
+        .then(data => {
+            importStatus.dataset.status = data.status;
+            importStatus.textContent = `Импорт: ${data.status_display}, строк ${data.processed}, найдено ${data.matched}`;
+            if (data.error) {
+                importStatus.textContent += ` (${data.error})`;
+            }
+            setTimeout(pollImport, 2000);
+        })
+        .catch(error => setTimeout(pollImport, 5000))
+}
+
+pollImport();
@@ -0,0 +1,220 @@
+import io
+import mimetypes
+import os
+import re
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+CHUNK_SIZE = 64 * 1024
+
+MAX_RANGES = 20
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def get_sendfile_backend():
+    return getattr(settings, 'VIDEO_SENDFILE_BACKEND', None)
+
+
+def parse_range_header(header, size):
+    if not header or '=' not in header:
+        return None
+    unit, ranges = header.split('=', 1)
+    if unit.strip().lower() != 'bytes':
+        return None
+    result = []
+    for spec in ranges.split(','):
+        match = RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+        result.append((start, end))
+    if not result:
+        raise RangeNotSatisfiable(header)
+    if len(result) > MAX_RANGES:
+        return None
+    return merge_ranges(result)
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def get_file_etag(stat):
+    return '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def if_range_matches(request, etag, last_modified):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    try:
+        return int(parsedate_to_datetime(value).timestamp()) == int(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+class RangeFile:
+    """Файл, ограниченный диапазоном байт [start, end].
+
+    Позиция исходного файла остается на начале диапазона, поэтому
+    wsgi.file_wrapper сервера (gunicorn) может отдать его через os.sendfile.
+    """
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.name = getattr(file, 'name', '')
+        self.file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            position = self.end + 1 + offset
+        elif whence == io.SEEK_CUR:
+            position = self.file.tell() + offset
+        else:
+            position = self.start + offset
+        self.file.seek(min(max(position, self.start), self.end + 1))
+        return self.tell()
+
+    def read(self, size=-1):
+        remaining = self.end + 1 - self.file.tell()
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+def stream_ranges(path, ranges, size, content_type, boundary):
+    with open(path, 'rb') as file:
+        for start, end in ranges:
+            yield (
+                f'--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode()
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            yield b'\r\n'
+        yield f'--{boundary}--\r\n'.encode()
+
+
+def multipart_length(ranges, size, content_type, boundary):
+    length = len(f'--{boundary}--\r\n')
+    for start, end in ranges:
+        length += len(
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        )
+        length += end - start + 1 + 2
+    return length
+
+
+def accel_response(name, path, content_type, etag, last_modified):
+    response = HttpResponse(content_type=content_type)
+    backend = get_sendfile_backend()
+    if backend == 'x-accel-redirect':
+        prefix = getattr(settings, 'VIDEO_ACCEL_REDIRECT_PREFIX', '/protected/media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name.lstrip('/')
+    else:
+        response['X-Sendfile'] = path
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def serve_file(request, file_field):
+    """Отдает файл из FileField с поддержкой Range, If-Range и multipart/byteranges."""
+    return serve_path(request, file_field.path, file_field.name)
+
+
+def serve_path(request, path, name, content_type=None):
+    """Как serve_file, но для файла в MEDIA_ROOT по пути; name - путь относительно MEDIA_ROOT."""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = get_file_etag(stat)
+    last_modified = stat.st_mtime
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if get_sendfile_backend():
+        return accel_response(name, path, content_type, etag, last_modified)
+
+    ranges = None
+    if if_range_matches(request, etag, last_modified):
+        try:
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    if not ranges:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = FileResponse(RangeFile(open(path, 'rb'), start, end), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        boundary = etag.strip('"')
+        response = StreamingHttpResponse(
+            stream_ranges(path, ranges, size, content_type, boundary),
+            content_type=f'multipart/byteranges; boundary={boundary}',
+            status=206,
+        )
+        response['Content-Length'] = multipart_length(ranges, size, content_type, boundary)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
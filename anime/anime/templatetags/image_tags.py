@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html
+
+from anime.images import DENSITIES, get_derivative_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(file_field, preset, fmt='webp'):
+    return get_derivative_url(file_field, preset, fmt)
+
+
+@register.simple_tag
+def image_srcset(file_field, preset, fmt='webp'):
+    return ', '.join(
+        f'{get_derivative_url(file_field, preset, fmt, density)} {density}x' for density in DENSITIES
+    )
+
+
+@register.simple_tag
+def image_background(file_field, preset):
+    """CSS для background-image: запасной вариант в исходном формате и WebP через image-set."""
+    image_set = ', '.join(
+        f'url({get_derivative_url(file_field, preset, "webp", density)}) {density}x' for density in DENSITIES
+    )
+    return format_html(
+        'background-image: url({}); background-image: -webkit-image-set({}); background-image: image-set({});',
+        get_derivative_url(file_field, preset, 'fallback'), image_set, image_set,
+    )
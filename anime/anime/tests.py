@@ -0,0 +1,43 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .models import Comment
+from .pagination import CursorPaginator
+
+
+class CursorEncodingTest(SimpleTestCase):
+
+    def test_datetime_keeps_microseconds(self):
+        paginator = CursorPaginator(Comment.objects.all(), 2, ['-created_date'])
+        created = datetime.datetime(2022, 5, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+        cursor = paginator.encode_cursor({'created_date': created, 'id': 7}, 'next')
+        self.assertEqual(paginator.decode_cursor(cursor), ([created, 7], 'next'))
+
+
+class CursorPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author')
+        base = timezone.now().replace(microsecond=0)
+        # Все комментарии в пределах одной миллисекунды
+        for offset in (100, 200, 300, 400, 500):
+            comment = Comment.objects.create(author=author, text=str(offset))
+            Comment.objects.filter(pk=comment.pk).update(created_date=base + datetime.timedelta(microseconds=offset))
+        cls.expected = list(Comment.objects.order_by('-created_date', '-id'))
+
+    def test_next_then_prev_within_one_millisecond(self):
+        paginator = CursorPaginator(Comment.objects.all(), 2, ['-created_date'])
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([comment for page in pages for comment in page], self.expected)
+
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), list(expected))
+        self.assertFalse(page.has_previous())
@@ -0,0 +1,209 @@
+import atexit
+import fcntl
+import logging
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Anime, Ip
+from .sidebar import invalidate_sidebar
+from .trending import record_activity
+from .utils import adjust_counter
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_flush_interval():
+    return getattr(settings, 'VIEWS_FLUSH_INTERVAL', 10)
+
+
+def get_batch_size():
+    return getattr(settings, 'VIEWS_BATCH_SIZE', 500)
+
+
+class WriteViewsError(Exception):
+
+    def __init__(self, written):
+        super().__init__(written)
+        self.written = written
+
+
+def write_views(events):
+    """Записывает события пачками и возвращает число записанных; при ошибке - исключение с этим числом."""
+    batch_size = get_batch_size()
+    for start in range(0, len(events), batch_size):
+        try:
+            _write_batch(events[start:start + batch_size])
+        except Exception as e:
+            raise WriteViewsError(start) from e
+    return len(events)
+
+
+def _insert_pairs(pairs):
+    """Вставляет пары (anime_id, ip_id) и возвращает anime_id только реально добавленных строк."""
+    through = Anime.views.through
+    table = connection.ops.quote_name(through._meta.db_table)
+    anime_column = connection.ops.quote_name(through._meta.get_field('anime').column)
+    ip_column = connection.ops.quote_name(through._meta.get_field('ip').column)
+    values = ', '.join(['(%s, %s)'] * len(pairs))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({anime_column}, {ip_column}) VALUES {values} '
+            f'ON CONFLICT DO NOTHING RETURNING {anime_column}',
+            [value for pair in pairs for value in pair],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _write_batch(events):
+    anime_ids = {anime_id for anime_id, ip in events}
+    anime_ids = set(Anime.objects.filter(pk__in=anime_ids).values_list('pk', flat=True))
+    events = [(anime_id, ip) for anime_id, ip in events if anime_id in anime_ids]
+    if not events:
+        return
+    with transaction.atomic():
+        addresses = {ip for anime_id, ip in events}
+        ip_ids = dict(Ip.objects.filter(ip__in=addresses).values_list('ip', 'id'))
+        missing = addresses - ip_ids.keys()
+        if missing:
+            Ip.objects.bulk_create([Ip(ip=ip) for ip in missing], ignore_conflicts=True)
+            ip_ids.update(Ip.objects.filter(ip__in=missing).values_list('ip', 'id'))
+        pairs = sorted({(anime_id, ip_ids[ip]) for anime_id, ip in events})
+        # Счетчик растет только на вставленные строки: пара, уже записанная параллельным сбросом, отбрасывается ON CONFLICT
+        new_views = Counter(_insert_pairs(pairs))
+        by_delta = {}
+        for anime_id, delta in new_views.items():
+            by_delta.setdefault(delta, []).append(anime_id)
+        for delta, ids in by_delta.items():
+            adjust_counter(ids, 'views_count', delta)
+        record_activity(views=Counter(anime_id for anime_id, ip in set(events)))
+    if new_views:
+        invalidate_sidebar()
+
+
+class ViewBuffer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, anime_id, ip):
+        with self._lock:
+            self._events.append((anime_id, ip))
+            full = len(self._events) >= get_batch_size()
+        self.start()
+        if full:
+            self._wakeup.set()
+
+    def drain(self):
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def requeue(self, events):
+        with self._lock:
+            self._events[:0] = events
+
+    def flush(self):
+        events = self.drain()
+        if not events:
+            return 0
+        try:
+            return write_views(events)
+        except WriteViewsError as e:
+            # Незаписанные события возвращаются в буфер и пишутся при следующем сбросе
+            logger.exception('Не удалось записать %s просмотров, повтор при следующем сбросе',
+                             len(events) - e.written)
+            self.requeue(events[e.written:])
+            return e.written
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='views-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=get_flush_interval())
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(get_flush_interval())
+            self._wakeup.clear()
+            self.flush()
+            connection.close()
+
+
+class SpoolViewBuffer(ViewBuffer):
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def add(self, anime_id, ip):
+        with open(self.path, 'a') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            try:
+                spool.write(f'{anime_id}\t{ip}\n')
+            finally:
+                fcntl.flock(spool, fcntl.LOCK_UN)
+        self.start()
+
+    def requeue(self, events):
+        with open(self.path, 'a') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            try:
+                spool.writelines(f'{anime_id}\t{ip}\n' for anime_id, ip in events)
+            finally:
+                fcntl.flock(spool, fcntl.LOCK_UN)
+
+    def drain(self):
+        with open(self.path, 'a+') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            try:
+                spool.seek(0)
+                lines = spool.read().splitlines()
+                spool.truncate(0)
+            finally:
+                fcntl.flock(spool, fcntl.LOCK_UN)
+        events = []
+        for line in lines:
+            anime_id, _, ip = line.partition('\t')
+            if anime_id.isdigit() and ip:
+                events.append((int(anime_id), ip))
+        return events
+
+
+def get_view_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                if getattr(settings, 'VIEWS_TRACKING_BACKEND', 'memory') == 'spool':
+                    _buffer = SpoolViewBuffer(settings.VIEWS_SPOOL_PATH)
+                else:
+                    _buffer = ViewBuffer()
+    return _buffer
+
+
+def track_view(anime_id, ip):
+    if ip:
+        get_view_buffer().add(anime_id, ip)
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .models import Video
+from .page_cache import bump_content_version
+from .workers import submit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDITIONS = (
+    # имя, высота, битрейт видео, битрейт аудио
+    ('1080p', 1080, '5000k', '192k'),
+    ('720p', 720, '2800k', '128k'),
+    ('480p', 480, '1400k', '128k'),
+    ('360p', 360, '800k', '96k'),
+)
+
+HLS_DIR = 'hls'
+
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def get_ffmpeg():
+    return getattr(settings, 'FFMPEG_BINARY', 'ffmpeg')
+
+
+def get_ffprobe():
+    return getattr(settings, 'FFPROBE_BINARY', 'ffprobe')
+
+
+def get_renditions():
+    return getattr(settings, 'HLS_RENDITIONS', DEFAULT_RENDITIONS)
+
+
+def get_segment_duration():
+    return getattr(settings, 'HLS_SEGMENT_DURATION', 6)
+
+
+def get_output_dir(video_id):
+    return os.path.join(settings.MEDIA_ROOT, HLS_DIR, str(video_id))
+
+
+def probe(path):
+    output = subprocess.run(
+        [get_ffprobe(), '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format', path],
+        check=True, capture_output=True, timeout=120,
+    ).stdout
+    info = json.loads(output)
+    streams = info.get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    if video is None:
+        raise ValueError(f'В файле {path} нет видеодорожки')
+    return {
+        'height': int(video.get('height') or 0),
+        'has_audio': any(stream.get('codec_type') == 'audio' for stream in streams),
+        'duration': float(info.get('format', {}).get('duration') or 0),
+    }
+
+
+def select_renditions(height):
+    renditions = sorted(get_renditions(), key=lambda rendition: rendition[1], reverse=True)
+    selected = [rendition for rendition in renditions if rendition[1] <= height]
+    return selected or renditions[-1:]
+
+
+def build_hls_command(source, output_dir, renditions, has_audio):
+    segment = get_segment_duration()
+    split = ''.join(f'[v{index}]' for index in range(len(renditions)))
+    filters = [f'[0:v]split={len(renditions)}{split}']
+    for index, (name, height, video_bitrate, audio_bitrate) in enumerate(renditions):
+        filters.append(f'[v{index}]scale=-2:{height}[v{index}out]')
+    command = [get_ffmpeg(), '-y', '-v', 'error', '-i', source, '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for index, (name, height, video_bitrate, audio_bitrate) in enumerate(renditions):
+        command += [
+            '-map', f'[v{index}out]',
+            f'-c:v:{index}', 'libx264', f'-b:v:{index}', video_bitrate,
+            f'-maxrate:v:{index}', video_bitrate, f'-bufsize:v:{index}', video_bitrate,
+        ]
+        if has_audio:
+            command += ['-map', 'a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', audio_bitrate]
+            stream_map.append(f'v:{index},a:{index},name:{name}')
+        else:
+            stream_map.append(f'v:{index},name:{name}')
+    command += [
+        '-preset', 'veryfast', '-sc_threshold', '0',
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment})',
+        '-f', 'hls', '-hls_time', str(segment), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%04d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+    return command
+
+
+def extract_thumb(source, duration, destination):
+    position = min(duration * 0.1, 10) if duration else 0
+    subprocess.run(
+        [get_ffmpeg(), '-y', '-v', 'error', '-ss', f'{position:.2f}', '-i', source,
+         '-frames:v', '1', '-q:v', '2', destination],
+        check=True, capture_output=True, timeout=120,
+    )
+
+
+def package_video(video_id):
+    video = Video.objects.filter(pk=video_id).first()
+    if video is None or not video.video:
+        return False
+    source = video.video.name
+    Video.objects.filter(pk=video_id).update(hls_status='processing')
+    output_dir = get_output_dir(video_id)
+    work_dir = output_dir + '.tmp'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    try:
+        info = probe(video.video.path)
+        renditions = select_renditions(info['height'])
+        for name, *rest in renditions:
+            os.makedirs(os.path.join(work_dir, name), exist_ok=True)
+        subprocess.run(
+            build_hls_command(video.video.path, work_dir, renditions, info['has_audio']),
+            check=True, capture_output=True, timeout=getattr(settings, 'HLS_TIMEOUT', 60 * 60),
+        )
+        thumb = video.thumb.name
+        if not thumb:
+            thumb_path = os.path.join(work_dir, 'thumb.jpg')
+            extract_thumb(video.video.path, info['duration'], thumb_path)
+            with open(thumb_path, 'rb') as file:
+                video.thumb.save(f'{video.url or video.pk}.jpg', File(file), save=False)
+            thumb = video.thumb.name
+            os.remove(thumb_path)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        stderr = getattr(e, 'stderr', b'') or b''
+        logger.exception('Не удалось упаковать видео %s в HLS: %s', video_id, stderr.decode(errors='replace')[-2000:])
+        shutil.rmtree(work_dir, ignore_errors=True)
+        Video.objects.filter(pk=video_id, video=source).update(hls_status='failed')
+        return False
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.rename(work_dir, output_dir)
+    Video.objects.filter(pk=video_id, video=source).update(
+        hls_status='ready',
+        hls_playlist=f'{HLS_DIR}/{video_id}/master.m3u8',
+        hls_source=source,
+        duration=info['duration'],
+        thumb=thumb,
+    )
+    bump_content_version()
+    return True
+
+
+def remove_hls(video_id):
+    shutil.rmtree(get_output_dir(video_id), ignore_errors=True)
+
+
+def _run_job(video_id, source):
+    try:
+        package_video(video_id)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard((video_id, source))
+
+
+def submit_packaging(video_id, source):
+    with _in_flight_lock:
+        if (video_id, source) in _in_flight:
+            return
+        _in_flight.add((video_id, source))
+    submit('hls', 'HLS_WORKERS', _run_job, video_id, source)
+
+
+def schedule_packaging(video):
+    if not getattr(settings, 'HLS_AUTO_PACKAGE', True) or not video.video:
+        return
+    if video.video.name == video.hls_source and video.hls_status == 'ready':
+        return
+    video_id, source = video.pk, video.video.name
+    Video.objects.filter(pk=video_id).exclude(hls_source=source).update(hls_status='pending')
+    transaction.on_commit(lambda: submit_packaging(video_id, source))
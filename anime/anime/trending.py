@@ -0,0 +1,87 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import Anime, ActivityBucket
+
+
+def get_trending_settings():
+    return {
+        'window_days': getattr(settings, 'TRENDING_WINDOW_DAYS', 14),
+        'half_life_hours': getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48),
+        'hourly_retention_hours': getattr(settings, 'TRENDING_HOURLY_RETENTION_HOURS', 48),
+        'comment_weight': getattr(settings, 'TRENDING_COMMENT_WEIGHT', 5),
+    }
+
+
+def add_to_buckets(period, start, counts):
+    if not counts:
+        return
+    buckets = ActivityBucket.objects.filter(period=period, start=start)
+    existing = set(buckets.filter(anime_id__in=counts).values_list('anime_id', flat=True))
+    ActivityBucket.objects.bulk_create(
+        [ActivityBucket(anime_id=anime_id, period=period, start=start) for anime_id in counts if anime_id not in existing],
+        ignore_conflicts=True,
+    )
+    by_delta = defaultdict(list)
+    for anime_id, delta in counts.items():
+        by_delta[delta].append(anime_id)
+    for (views, comments), anime_ids in by_delta.items():
+        buckets.filter(anime_id__in=anime_ids).update(views=F('views') + views, comments=F('comments') + comments)
+
+
+def record_activity(views=None, comments=None, at=None):
+    start = (at or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    views, comments = views or {}, comments or {}
+    counts = {anime_id: (views.get(anime_id, 0), comments.get(anime_id, 0)) for anime_id in set(views) | set(comments)}
+    with transaction.atomic():
+        add_to_buckets('hour', start, counts)
+
+
+def roll_up_hourly(now):
+    options = get_trending_settings()
+    cutoff = (now - timedelta(hours=options['hourly_retention_hours'])).replace(minute=0, second=0, microsecond=0)
+    old_hours = ActivityBucket.objects.filter(period='hour', start__lt=cutoff)
+    rows = old_hours.annotate(day=TruncDay('start')).values('anime_id', 'day').\
+        annotate(total_views=Sum('views'), total_comments=Sum('comments')).order_by()
+    by_day = defaultdict(dict)
+    for row in rows:
+        by_day[row['day']][row['anime_id']] = (row['total_views'], row['total_comments'])
+    with transaction.atomic():
+        for day, counts in by_day.items():
+            add_to_buckets('day', day, counts)
+        old_hours.delete()
+        ActivityBucket.objects.filter(period='day', start__lt=now - timedelta(days=options['window_days'])).delete()
+
+
+def compute_trending_scores(now):
+    options = get_trending_settings()
+    decay = math.log(2) / options['half_life_hours']
+    scores = defaultdict(float)
+    rows = ActivityBucket.objects.filter(start__gte=now - timedelta(days=options['window_days'])).\
+        values_list('anime_id', 'period', 'start', 'views', 'comments')
+    for anime_id, period, start, views, comments in rows.iterator():
+        middle = start + (timedelta(hours=12) if period == 'day' else timedelta(minutes=30))
+        age_hours = max((now - middle).total_seconds() / 3600, 0)
+        scores[anime_id] += (views + comments * options['comment_weight']) * math.exp(-decay * age_hours)
+    return scores
+
+
+def update_trending(now=None):
+    now = now or timezone.now()
+    roll_up_hourly(now)
+    scores = compute_trending_scores(now)
+    with transaction.atomic():
+        Anime.objects.filter(trending_score__gt=0).exclude(pk__in=list(scores)).update(trending_score=0)
+        Anime.objects.bulk_update(
+            [Anime(pk=anime_id, trending_score=score) for anime_id, score in scores.items()],
+            ['trending_score'],
+            batch_size=500,
+        )
+    return len(scores)
@@ -3,10 +3,20 @@ from django.conf.urls.static import static
 from django.urls import path
 from django.contrib.auth.views import LogoutView
 
+from .api import (
+    AnimeListApi,
+    AnimeDetailApi,
+    EpisodeListApi,
+    GenreListApi,
+    StudioListApi,
+    DirectorsListApi,
+    ProfileListApi,
+)
 from .filter import FilterForAnime, FilterForGenre
 from .views import (
     AnimeListView,
     AnimeDetailView,
+    AnimeCommentsView,
     ProfileView,
     AddToList,
     AddToFavorite,
@@ -16,7 +26,12 @@ from .views import (
     ProfileFavoriteView,
     UpdateProfileView,
     AddStarRating,
+    ExportListView,
+    ImportListView,
+    ListImportStatusView,
     DisplayVideo,
+    StreamVideo,
+    StreamHlsVideo,
     DeleteCommentView,
     GenreListView,
     GenreDetailView,
@@ -41,10 +56,13 @@ urlpatterns = [
     path('anime/all/filter', FilterForAnime.as_view(), name='anime_filter'),
     path('anime/genre/filter', FilterForGenre.as_view(), name='anime_filter_genre'),
     path('anime/<slug:slug>', AnimeDetailView.as_view(), name='anime_detail'),
+    path('anime/<slug:slug>/comments', AnimeCommentsView.as_view(), name='anime_comments'),
     path('profile/<int:pk>', ProfileView.as_view(), name='profile_detail'),
     path('profile/<int:pk>/update', UpdateProfileView.as_view(), name='profile_update'),
     path('add-rating/', AddStarRating.as_view(), name='add_rating'),
     path('anime/video/<slug:slug>/<str:series>', DisplayVideo.as_view(), name='anime_video'),
+    path('anime/video/<slug:slug>/<str:series>/stream', StreamVideo.as_view(), name='anime_video_stream'),
+    path('anime/video/<slug:slug>/<str:series>/hls/<path:name>', StreamHlsVideo.as_view(), name='anime_video_hls'),
     # AnimeList
     path('profile/<int:pk>/will_watching', ProfileWillWatchView.as_view(), name='will_watching'),
     path('profile/<int:pk>/viewed', ProfileViewedView.as_view(), name='viewed'),
@@ -53,6 +71,10 @@ urlpatterns = [
     # Add AnimeList
     path('add-to-will-watching/', AddToList.as_view(), name='add_to_anime_list'),
     path('add-to-favorite/', AddToFavorite.as_view(), name='add_to_favorite'),
+    # Import/export AnimeList
+    path('profile/list/export', ExportListView.as_view(), name='export_list'),
+    path('profile/list/import', ImportListView.as_view(), name='import_list'),
+    path('profile/list/import/<int:pk>', ListImportStatusView.as_view(), name='list_import_status'),
 
     path('anime/genres/', GenreListView.as_view(), name='genre_list'),
     path('anime/genres/<slug:slug>', GenreDetailView.as_view(), name='genre_detail'),
@@ -61,6 +83,15 @@ urlpatterns = [
     path('comment/delete/', DeleteCommentView.as_view(), name='delete_comment'),
 
     path('search/', Search.as_view(), name='search'),
+
+    # API
+    path('api/anime', AnimeListApi.as_view(), name='api_anime_list'),
+    path('api/anime/<slug:slug>', AnimeDetailApi.as_view(), name='api_anime_detail'),
+    path('api/anime/<slug:slug>/episodes', EpisodeListApi.as_view(), name='api_episodes'),
+    path('api/genres', GenreListApi.as_view(), name='api_genres'),
+    path('api/studios', StudioListApi.as_view(), name='api_studios'),
+    path('api/directors', DirectorsListApi.as_view(), name='api_directors'),
+    path('api/profiles/<int:pk>/list', ProfileListApi.as_view(), name='api_profile_list'),
 ]
 
 if settings.DEBUG:
@@ -1,60 +1,59 @@
-import random
-from django.db.models import Max, Count
-from .models import Anime, Comment, WatchingNow, WillWatch, Throw, Viewed
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Max, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+from .models import Anime, AnimeListEntry, Rating
+from .random_pick import random_picker
 
 
-def get_random():
-    max_id = Anime.objects.all().aggregate(max_id=Max('id'))['max_id']
-    while True:
-        pk = random.randint(1, max_id)
-        anime = Anime.objects.filter(pk=pk).first()
-        if anime:
-            return anime
+def get_random(**filters):
+    return random_picker.pick(**filters)
 
 
-def get_comments():
-    comments = Comment.objects.all().select_related('anime').prefetch_related('anime__views').order_by('-created_date')
-    comment_list = []
-    for comment_i in comments:
-        for comment_j in comments:
-            if comment_i.anime == comment_j.anime:
-                if comment_i.anime not in comment_list:
-                    comment_list.append(comment_i.anime)
-    return comment_list
+def get_recently_discussed():
+    queryset = Anime.objects.annotate(last_comment_date=Max('comments__created_date')).\
+        filter(last_comment_date__isnull=False).\
+        order_by('-last_comment_date', '-id')
+    return queryset
 
 
 def top_views():
-    top_views = Anime.objects.all().prefetch_related('views').annotate(views_cnt=Count('views')).order_by('-views_cnt')
+    top_views = Anime.objects.all().order_by('-trending_score', '-views_count')
     return top_views
 
-def add_anime_to_list(profile, anime, model_name, anime_list):
-    model_list = [WatchingNow, WillWatch, Viewed, Throw]
-    fields_list = [anime_list.watching_now, anime_list.will_watch, anime_list.viewed, anime_list.throw]
-    field = None
-    current_model = None
-    for model in model_list:
-        if model_name == model.__name__:
-            current_model = model
-            model_list.remove(model)
-    for anime_list_field in fields_list:
-        if model_name == anime_list_field.model.__name__:
-            field = anime_list_field
-    for model in model_list:
-        try:
-            object = model.objects.get(user=profile, anime=anime, anime_list=anime_list)
-            object.delete()
-        except model.DoesNotExist:
-            print('Object DoesNotExist')
-    obj, created = current_model.objects.get_or_create(
-        user=profile,
-        anime=anime,
-        anime_list=anime_list
+
+def adjust_counter(anime_ids, field, delta):
+    Anime.objects.filter(pk__in=anime_ids).update(**{field: Greatest(F(field) + delta, Value(0))})
+
+def _upsert_list_entry(profile, anime, update, defaults):
+    entries = AnimeListEntry.objects.filter(profile=profile, anime=anime)
+    with transaction.atomic():
+        if not entries.update(updated_date=timezone.now(), **update):
+            try:
+                with transaction.atomic():
+                    AnimeListEntry.objects.create(profile=profile, anime=anime, **defaults)
+            except IntegrityError:
+                entries.update(updated_date=timezone.now(), **update)
+        entries.filter(status__isnull=True, favorite=False).delete()
+
+
+def toggle_list_status(profile, anime, status):
+    _upsert_list_entry(
+        profile,
+        anime,
+        update={'status': Case(When(status=status, then=Value(None)), default=Value(status))},
+        defaults={'status': status},
+    )
+
+
+def toggle_favorite(profile, anime):
+    _upsert_list_entry(
+        profile,
+        anime,
+        update={'favorite': Case(When(favorite=True, then=Value(False)), default=Value(True))},
+        defaults={'favorite': True},
     )
-    if created:
-        field.add(obj)
-    else:
-        field.remove(obj)
-        obj.delete()
 
 
 def get_client_ip(request):
@@ -66,21 +65,68 @@ def get_client_ip(request):
     return ip
 
 def get_trending_anime():
-    queryset = Anime.objects.prefetch_related('comments', 'views').\
-        annotate(views_cnt=Count('views'), comm_cnt=Count('comments')).\
-        order_by('-views_cnt', '-comm_cnt', '-year')
+    queryset = Anime.objects.order_by('-trending_score', '-views_count')
     return queryset
 
 def get_popular_anime():
-    queryset = Anime.objects.prefetch_related('comments', 'views').\
-        annotate(views_cnt=Count('views'), comm_cnt=Count('comments')).\
-        order_by('-views_cnt', '-comm_cnt')
+    queryset = Anime.objects.order_by('-views_count', '-comments_count')
+    return queryset
+
+def get_recommended_anime(profile):
+    queryset = Anime.objects.filter(recommended_to__profile=profile).order_by('-recommended_to__score')
     return queryset
 
 def get_recent_anime():
-    queryset = Anime.objects.prefetch_related('comments', 'views').order_by('-year')
+    queryset = Anime.objects.order_by('-year')
     return queryset
 
 
+def get_rating_prior():
+    return getattr(settings, 'RATING_PRIOR_WEIGHT', 10), getattr(settings, 'RATING_PRIOR_MEAN', 5)
+
 
+def aggregate_subquery(queryset, aggregate):
+    """Агрегат строк queryset по anime_id текущего аниме (0 без строк) - для Anime.objects.update()."""
+    queryset = queryset.filter(anime_id=OuterRef('pk')).order_by().values('anime_id')
+    return Coalesce(Subquery(queryset.annotate(value=aggregate).values('value'), output_field=IntegerField()), 0)
 
+
+def recompute_rating_aggregates(anime_ids=None):
+    weight, mean = get_rating_prior()
+    queryset = Anime.objects.all()
+    if anime_ids is not None:
+        queryset = queryset.filter(pk__in=anime_ids)
+    updated = queryset.update(
+        rating_sum=aggregate_subquery(Rating.objects.all(), Sum('star__value')),
+        ratings_count=aggregate_subquery(Rating.objects.all(), Count('*')),
+    )
+    queryset.update(
+        rating_score=(Value(weight * mean, output_field=FloatField()) + Cast('rating_sum', FloatField())) /
+                     (Value(weight, output_field=FloatField()) + Cast('ratings_count', FloatField()))
+    )
+    return updated
+
+
+def refresh_rating_aggregates(anime_id):
+    with transaction.atomic():
+        # Сначала блокируем аниме: пересчет после ожидания увидит оценки параллельных транзакций
+        if list(Anime.objects.select_for_update().filter(pk=anime_id).values_list('pk', flat=True)):
+            recompute_rating_aggregates([anime_id])
+
+
+def rate_anime(profile, anime_id, star):
+    """Создает или меняет оценку; сумму и количество оценок у аниме пересчитывают сигналы Rating."""
+    with transaction.atomic():
+        ratings = Rating.objects.select_for_update().filter(profile=profile, anime_id=anime_id)
+        rating = ratings.first()
+        if rating is None:
+            try:
+                with transaction.atomic():
+                    Rating.objects.create(profile=profile, anime_id=anime_id, star=star)
+                return
+            except IntegrityError:
+                # Параллельный запрос уже создал оценку - обновляем ее
+                rating = ratings.first()
+        if rating.star_id != star.pk:
+            rating.star = star
+            rating.save(update_fields=['star'])
@@ -1,35 +1,53 @@
+import os
+import posixpath
+import re
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import HttpResponse
-from django.shortcuts import redirect
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.utils.cache import get_conditional_response
 from django.views import View
 from django.views.generic import ListView, DetailView, UpdateView
 from django.views.generic.list import MultipleObjectMixin
-from .forms import ProfileUpdateForm, RatingForm
-from django.db.models import Q
+from .forms import ListImportForm, ProfileUpdateForm, RatingForm
+from urllib.parse import urlencode
 
 from .models import (
     Anime,
     Profile,
-    AnimeList,
-    Favorite,
-    Ip,
-    Rating,
+    AnimeListEntry,
+    ListImport,
     Video,
     Comment,
     Genre,
     Directors,
     Studio
 )
-from .mixins import CommentMixin, CustomContextMixin, ProfileContextMixin
+from .mixins import AnonymousPageCacheMixin, CommentListMixin, CommentMixin, CustomContextMixin, CursorPaginationMixin, MemoizedObjectMixin, ProfileListMixin
 from .filter import FilterList
-from .utils import add_anime_to_list, get_client_ip, get_trending_anime, get_popular_anime, get_recent_anime
+from .list_io import detect_format, iter_csv, iter_mal_xml, schedule_import
+from .search import search_anime
+from .streaming import serve_path
+from .tracking import track_view
+from .utils import toggle_list_status, toggle_favorite, rate_anime, get_client_ip, get_trending_anime, get_popular_anime, get_recent_anime,\
+    get_recommended_anime
 
 User = get_user_model()
 
+# Файлы внутри каталога HLS серии: master.m3u8, <качество>/index.m3u8, <качество>/segment_0001.ts
+HLS_FILE_RE = re.compile(r'^(?:[\w-]+/)?[\w-]+\.(m3u8|ts)$')
+
+HLS_CONTENT_TYPES = {
+    'm3u8': 'application/vnd.apple.mpegurl',
+    'ts': 'video/mp2t',
+}
+
 
-class TrendingView(CustomContextMixin, ListView):
+class TrendingView(AnonymousPageCacheMixin, CursorPaginationMixin, CustomContextMixin, ListView):
     model = Anime
     context_object_name = 'trending'
     paginate_by = 18
@@ -40,7 +58,7 @@ class TrendingView(CustomContextMixin, ListView):
         return queryset
 
 
-class PopularView(CustomContextMixin, ListView):
+class PopularView(AnonymousPageCacheMixin, CursorPaginationMixin, CustomContextMixin, ListView):
     model = Anime
     context_object_name = 'popular'
     paginate_by = 18
@@ -51,23 +69,23 @@ class PopularView(CustomContextMixin, ListView):
         return queryset
 
 
-class RecentView(CustomContextMixin, ListView):
+class RecentView(AnonymousPageCacheMixin, CursorPaginationMixin, CustomContextMixin, ListView):
     model = Anime
-    queryset = Anime.objects.prefetch_related('comments', 'views').order_by('-year')
+    queryset = Anime.objects.order_by('-year')
     context_object_name = 'recent'
     paginate_by = 18
     template_name = 'anime/recent.html'
 
 
-class AllAnimeView(FilterList, CustomContextMixin, ListView):
+class AllAnimeView(AnonymousPageCacheMixin, CursorPaginationMixin, FilterList, CustomContextMixin, ListView):
     model = Anime
-    queryset = Anime.objects.prefetch_related('comments', 'views')
+    queryset = Anime.objects.all()
     template_name = 'anime/anime_all.html'
     context_object_name = 'anime_all'
     paginate_by = 18
 
 
-class AnimeListView(CustomContextMixin, ListView):
+class AnimeListView(AnonymousPageCacheMixin, CustomContextMixin, ListView):
     model = Anime
     template_name = 'anime/anime_list.html'
 
@@ -76,6 +94,8 @@ class AnimeListView(CustomContextMixin, ListView):
         context['popular'] = get_popular_anime()[:6]
         context['trending'] = get_trending_anime()[:6]
         context['recent'] = get_recent_anime()[:6]
+        if self.request.user.is_authenticated:
+            context['for_you'] = get_recommended_anime(self.request.user.profile)[:6] or context['popular']
         return context
 
 
@@ -92,97 +112,197 @@ class UpdateProfileView(LoginRequiredMixin, UserPassesTestMixin, CustomContextMi
         return reverse('anime:profile_detail', kwargs={'pk': self.object.pk})
 
 
-class AnimeDetailView(CustomContextMixin, CommentMixin, DetailView):
+class AnimeDetailView(AnonymousPageCacheMixin, MemoizedObjectMixin, CustomContextMixin, CommentMixin, DetailView):
     model = Anime
     queryset = Anime.objects.select_related('studio')
     slug_field = 'url'
     context_object_name = 'anime_detail'
     template_name = 'anime/anime_detail.html'
 
-    def dispatch(self, request, *args, **kwargs):
-        anime = self.get_object()
-        ip = get_client_ip(request)
-        views_ip, created = Ip.objects.get_or_create(ip=ip)
-        anime.views.add(views_ip)
-        return super().dispatch(request, *args, **kwargs)
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        track_view(self.object.pk, get_client_ip(request))
+        return response
+
+    def get_page_cache_meta(self):
+        return {'anime_id': self.object.pk}
+
+    def page_cache_hit(self, meta):
+        track_view(meta['anime_id'], get_client_ip(self.request))
 
     def get_context_data(self, *args, **kwargs):
-        anime = self.get_object()
-        genre = anime.genre.all()
-        similar_anime = Anime.objects.prefetch_related('views').filter(genre__in=genre).exclude(
-            id=anime.id).distinct()[:4]
+        anime = self.object
+        similar_anime = Anime.objects.filter(similar_to__anime=anime).order_by('-similar_to__score')[:4]
         context = super().get_context_data(*args, **kwargs)
         context['similar_anime'] = similar_anime
         context['star_form'] = RatingForm()
+        context['comments_page'] = self.get_comments_page()
+        if self.request.user.is_authenticated:
+            context['list_entry'] = AnimeListEntry.objects.filter(
+                profile=self.request.user.profile, anime=anime).first()
+        return context
+
+
+class AnimeCommentsView(AnonymousPageCacheMixin, MemoizedObjectMixin, CommentListMixin, DetailView):
+    model = Anime
+    queryset = Anime.objects.only('pk', 'url')
+    slug_field = 'url'
+    context_object_name = 'anime_detail'
+    template_name = 'anime/comments_page.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['comments_page'] = self.get_comments_page(self.request.GET.get('cursor'))
         return context
 
 
-class DisplayVideo(CustomContextMixin, DetailView):
+class DisplayVideo(AnonymousPageCacheMixin, MemoizedObjectMixin, CustomContextMixin, DetailView):
     model = Video
     template_name = 'anime/anime_video.html'
     slug_field = 'url'
     context_object_name = 'video'
 
 
+class StreamVideo(View):
+
+    def has_access(self, request, video):
+        if getattr(settings, 'VIDEO_STREAM_LOGIN_REQUIRED', False):
+            return request.user.is_authenticated
+        return True
+
+    def get_file(self, video):
+        if not video.video:
+            raise Http404
+        path = video.video.path
+        if not os.path.isfile(path):
+            raise Http404
+        return path, video.video.name, None
+
+    def get(self, request, *args, **kwargs):
+        video = get_object_or_404(Video, url=kwargs['slug'])
+        if not self.has_access(request, video):
+            return redirect_to_login(video.get_absolute_url())
+        path, name, content_type = self.get_file(video)
+        response = serve_path(request, path, name, content_type)
+        if response.status_code == 200 and 'HTTP_RANGE' not in request.META:
+            not_modified = get_conditional_response(request, etag=response['ETag'])
+            if not_modified is not None:
+                response.close()
+                return not_modified
+        return response
+
+
+class StreamHlsVideo(StreamVideo):
+    """Плейлисты и сегменты HLS с той же проверкой доступа, что и у mp4."""
+
+    def get_file(self, video):
+        name = self.kwargs['name']
+        match = HLS_FILE_RE.match(name)
+        if video.hls_status != 'ready' or not video.hls_playlist or not match:
+            raise Http404
+        name = posixpath.join(posixpath.dirname(video.hls_playlist), name)
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if not os.path.isfile(path):
+            raise Http404
+        return path, name, HLS_CONTENT_TYPES[match.group(1)]
+
+
 class AddToList(LoginRequiredMixin, View):
 
     def post(self, request, *args, **kwargs):
         anime_id = request.POST.get('anime_id')
-        model_name = request.POST.get('model_name')
-        profile = self.request.user.profile
+        status = request.POST.get('status')
+        if status not in dict(AnimeListEntry.STATUS_CHOICES):
+            return HttpResponse(status=400)
         anime = Anime.objects.get(id=anime_id)
-        anime_list = AnimeList.objects.get(owner=profile)
-        add_anime_to_list(profile, anime, model_name, anime_list)
+        toggle_list_status(request.user.profile, anime, status)
         return redirect('anime:anime_detail', slug=anime.url)
 
 
 class AddToFavorite(LoginRequiredMixin, View):
 
     def post(self, request, *args, **kwargs):
-        profile = request.user.profile
         anime_id = request.POST.get('anime_id')
         anime = Anime.objects.get(id=anime_id)
-        anime_list = AnimeList.objects.get(owner=profile)
-        favorite, created = Favorite.objects.get_or_create(
-            user=profile,
-            anime=anime,
-            anime_list=anime_list
-        )
-        if created:
-            anime_list.favorite.add(favorite)
-        else:
-            anime_list.favorite.remove(favorite)
-            favorite.delete()
+        toggle_favorite(request.user.profile, anime)
         return redirect('anime:anime_detail', slug=anime.url)
 
 
-class ProfileView(ProfileContextMixin, DetailView):
-    queryset = Profile.objects.prefetch_related('watching', 'watching__anime').select_related('user')
+class ProfileView(ProfileListMixin, DetailView):
+    queryset = Profile.objects.select_related('user')
     template_name = 'profile/profile.html'
+    list_filter = {'status': 'watching'}
 
 
-class ProfileWillWatchView(ProfileContextMixin, DetailView):
-    queryset = Profile.objects.prefetch_related('will_watch', 'will_watch__anime').select_related('user')
+class ProfileWillWatchView(ProfileListMixin, DetailView):
+    queryset = Profile.objects.select_related('user')
     template_name = 'profile/profile_willwatch.html'
     context_object_name = 'profile'
+    list_filter = {'status': 'will_watch'}
 
 
-class ProfileViewedView(ProfileContextMixin, DetailView):
-    queryset = Profile.objects.prefetch_related('viewed', 'viewed__anime').select_related('user')
+class ProfileViewedView(ProfileListMixin, DetailView):
+    queryset = Profile.objects.select_related('user')
     template_name = 'profile/profile_viewed.html'
     context_object_name = 'profile'
+    list_filter = {'status': 'viewed'}
 
 
-class ProfileThrowView(ProfileContextMixin, DetailView):
-    queryset = Profile.objects.prefetch_related('throw', 'throw__anime').select_related('user')
+class ProfileThrowView(ProfileListMixin, DetailView):
+    queryset = Profile.objects.select_related('user')
     template_name = 'profile/profile_throw.html'
     context_object_name = 'profile'
+    list_filter = {'status': 'throw'}
 
 
-class ProfileFavoriteView(ProfileContextMixin, DetailView):
-    queryset = Profile.objects.prefetch_related('favorite', 'favorite__anime').select_related('user')
+class ProfileFavoriteView(ProfileListMixin, DetailView):
+    queryset = Profile.objects.select_related('user')
     template_name = 'profile/profile_favorite.html'
     context_object_name = 'profile'
+    list_filter = {'favorite': True}
+
+
+class ExportListView(LoginRequiredMixin, View):
+    exporters = {
+        'csv': (iter_csv, 'text/csv; charset=utf-8'),
+        'xml': (iter_mal_xml, 'application/xml; charset=utf-8'),
+    }
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in self.exporters:
+            return HttpResponse(status=400)
+        exporter, content_type = self.exporters[fmt]
+        response = StreamingHttpResponse(exporter(request.user.profile), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="anime-list.{fmt}"'
+        return response
+
+
+class ImportListView(LoginRequiredMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        form = ListImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return HttpResponse(status=400)
+        list_import = form.save(commit=False)
+        list_import.profile = request.user.profile
+        list_import.format = detect_format(list_import.file.name)
+        list_import.save()
+        schedule_import(list_import)
+        return redirect('anime:profile_detail', pk=request.user.profile.pk)
+
+
+class ListImportStatusView(LoginRequiredMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        list_import = get_object_or_404(ListImport, pk=kwargs['pk'], profile=request.user.profile)
+        return JsonResponse({
+            'status': list_import.status,
+            'status_display': list_import.get_status_display(),
+            'processed': list_import.processed,
+            'matched': list_import.matched,
+            'error': list_import.error,
+        })
 
 
 class AddStarRating(LoginRequiredMixin, View):
@@ -191,11 +311,7 @@ class AddStarRating(LoginRequiredMixin, View):
         form = RatingForm(request.POST)
         prof = Profile.objects.get(user=request.user)
         if form.is_valid():
-            Rating.objects.update_or_create(
-                profile=prof,
-                anime_id=int(request.POST.get('anime')),
-                defaults={'star_id': int(request.POST.get('star'))}
-            )
+            rate_anime(prof, int(request.POST.get('anime')), form.cleaned_data['star'])
             return HttpResponse(status=200)
         else:
             return HttpResponse(status=400)
@@ -217,60 +333,65 @@ class DeleteCommentView(LoginRequiredMixin, UserPassesTestMixin, View):
         return redirect('anime:anime_detail', slug=anime.url)
 
 
-class GenreListView(CustomContextMixin, ListView):
+class GenreListView(AnonymousPageCacheMixin, CustomContextMixin, ListView):
     model = Genre
     queryset = Genre.objects.all()
     context_object_name = 'genres'
     template_name = 'anime/genre.html'
 
 
-class GenreDetailView(CustomContextMixin, FilterList, DetailView, MultipleObjectMixin):
+class GenreDetailView(AnonymousPageCacheMixin, MemoizedObjectMixin, CursorPaginationMixin, CustomContextMixin, FilterList, DetailView, MultipleObjectMixin):
     model = Genre
     paginate_by = 18
     slug_field = 'url'
     template_name = 'anime/genre_detail.html'
+    hidden_facets = ('genre',)
+
+    def get_selected_facets(self):
+        return {'genre': [str(self.object.pk)]}
 
     def get_context_data(self, **kwargs):
-        object_list = Anime.objects.prefetch_related('comments', 'views').filter(genre=self.get_object())
+        object_list = Anime.objects.filter(genre=self.object)
         context = super().get_context_data(object_list=object_list, **kwargs)
-        context['genre'] = self.get_object()
+        context['genre'] = self.object
         return context
 
 
-class DirectorsDetailView(CustomContextMixin, DetailView, MultipleObjectMixin):
+class DirectorsDetailView(AnonymousPageCacheMixin, MemoizedObjectMixin, CursorPaginationMixin, CustomContextMixin, DetailView, MultipleObjectMixin):
     model = Directors
     paginate_by = 18
     slug_field = 'url'
     template_name = 'anime/directors_detail.html'
 
     def get_context_data(self, **kwargs):
-        object_list = Anime.objects.prefetch_related('comments', 'views').filter(directors=self.get_object())
+        object_list = Anime.objects.filter(directors=self.object)
         context = super().get_context_data(object_list=object_list, **kwargs)
         return context
 
 
-class StudioDetailView(CustomContextMixin, DetailView, MultipleObjectMixin):
+class StudioDetailView(AnonymousPageCacheMixin, MemoizedObjectMixin, CursorPaginationMixin, CustomContextMixin, DetailView, MultipleObjectMixin):
     model = Studio
     paginate_by = 18
     slug_field = 'url'
     template_name = 'anime/studio_detail.html'
 
     def get_context_data(self, **kwargs):
-        object_list = Anime.objects.prefetch_related('comments', 'views').filter(studio=self.get_object())
+        object_list = Anime.objects.filter(studio=self.object)
         context = super().get_context_data(object_list=object_list, **kwargs)
         return context
 
 
-class Search(CustomContextMixin, ListView):
+class Search(AnonymousPageCacheMixin, CustomContextMixin, ListView):
     model = Anime
     template_name = 'search.html'
+    context_object_name = 'q'
+    paginate_by = 18
+
+    def get_queryset(self):
+        return search_anime(self.request.GET.get('q'))
 
     def get_context_data(self, **kwargs):
-        anime = Anime.objects.prefetch_related('comments', 'views').filter(
-            Q(title__icontains=self.request.GET.get('q')) | Q(second_title__icontains=self.request.GET.get('q')))
         context = super().get_context_data(**kwargs)
-        context['search_request'] = self.request.GET.get('q')
-        context['q'] = anime
+        context['search_request'] = self.request.GET.get('q', '')
+        context['page_query'] = urlencode({'q': context['search_request']}) + '&'
         return context
-
-
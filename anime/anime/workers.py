@@ -0,0 +1,35 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .db_router import use_primary
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor(name, workers_setting, default_workers=2):
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=getattr(settings, workers_setting, default_workers),
+                thread_name_prefix=name,
+            )
+        return _executors[name]
+
+
+def _call(func, args):
+    close_old_connections()
+    try:
+        # Задачи ставятся после commit и читают только что записанные строки - реплика может отставать
+        with use_primary():
+            return func(*args)
+    finally:
+        close_old_connections()
+
+
+def submit(name, workers_setting, func, *args):
+    """Запускает func(*args) в фоновом пуле name, не блокируя запрос."""
+    return get_executor(name, workers_setting).submit(_call, func, args)
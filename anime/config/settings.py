@@ -39,8 +39,8 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'anime',
-    'debug_toolbar',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -53,17 +53,22 @@ AUTHENTICATION_BACKENDS = [
 
 
 MIDDLEWARE = [
+    'anime.middleware.SqlInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'anime.db_router.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# debug_toolbar только для разработки
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -99,6 +104,13 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (см. anime.db_router). Для локальной проверки достаточно
+# второго алиаса на ту же базу:
+# DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+# DATABASE_REPLICAS = ['replica']
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['anime.db_router.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -137,6 +149,7 @@ USE_TZ = True
 STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'var', 'private')
 STATIC_ROOT = os.path.join(BASE_DIR, "static/")
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -159,4 +172,106 @@ EMAIL_HOST_USER = 'animegoproject@gmail.com'
 EMAIL_HOST_PASSWORD = '456789123z'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
-SITE_ID = 1
\ No newline at end of file
+SITE_ID = 1
+
+
+# Учёт просмотров: 'memory' - буфер в процессе, 'spool' - общий файл для нескольких процессов
+VIEWS_TRACKING_BACKEND = 'memory'
+VIEWS_FLUSH_INTERVAL = 10
+VIEWS_BATCH_SIZE = 500
+VIEWS_SPOOL_PATH = os.path.join(BASE_DIR, 'var', 'views.spool')
+
+
+# Кеш сайдбара. Если общий кеш (redis, memcached) не настроен в CACHES,
+# используется локальный кеш процесса с коротким временем жизни
+SIDEBAR_CACHE_ALIAS = 'default'
+SIDEBAR_CACHE_TIMEOUT = 60 * 5
+SIDEBAR_LOCAL_CACHE_TIMEOUT = 30
+
+# Как часто (в секундах) перечитывать список аниме для случайного выбора
+RANDOM_ANIME_REFRESH_INTERVAL = 60 * 5
+
+# Поиск: 'auto' - PostgreSQL full-text, на других базах - индекс в памяти процесса
+SEARCH_BACKEND = 'auto'
+SEARCH_TRIGRAM_THRESHOLD = 0.3
+SEARCH_INDEX_REFRESH_INTERVAL = 60 * 5
+
+# Как часто (в секундах) полностью перестраивать индекс фильтров каталога
+FACET_INDEX_REFRESH_INTERVAL = 60 * 5
+
+# Байесовский рейтинг: (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + сумма) / (RATING_PRIOR_WEIGHT + кол-во оценок)
+RATING_PRIOR_WEIGHT = 10
+RATING_PRIOR_MEAN = 5
+
+# Похожие аниме: сколько соседей хранить и пересчитывать ли их при изменении аниме
+SIMILARITY_TOP_K = 12
+SIMILARITY_AUTO_REFRESH = True
+SIMILARITY_WORKERS = 1
+# Как часто (в секундах) полностью перечитывать матрицу признаков; между загрузками меняются только строки правленых аниме
+SIMILARITY_FEATURES_REFRESH_INTERVAL = 60 * 60
+
+# Рекомендации: сколько аниме хранить на профиль и сколько соседей у каждого аниме
+RECOMMENDATIONS_TOP_N = 30
+RECOMMENDATIONS_NEIGHBOURS = 50
+
+# Актуальные аниме: окно активности, период полураспада и вес комментария относительно просмотра.
+# Пересчет запускается периодически командой update_trending (cron)
+TRENDING_WINDOW_DAYS = 14
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_HOURLY_RETENTION_HOURS = 48
+TRENDING_COMMENT_WEIGHT = 5
+
+# Показывать примерное число аниме (по оценке планировщика PostgreSQL) при постраничной навигации по курсору
+CURSOR_PAGINATION_APPROXIMATE_COUNT = False
+
+# Кеш страниц для анонимных пользователей (ETag/Last-Modified из версии контента)
+# Без общего кеша в CACHES версия хранится в БД (ContentVersion) и перечитывается раз в PAGE_LOCAL_CACHE_TIMEOUT
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGE_LOCAL_CACHE_TIMEOUT = 30
+
+# Отдача видео: None - через Django (Range/sendfile), 'x-accel-redirect' - nginx, 'x-sendfile' - apache/lighttpd
+VIDEO_SENDFILE_BACKEND = None
+VIDEO_ACCEL_REDIRECT_PREFIX = '/protected/media/'
+VIDEO_STREAM_LOGIN_REQUIRED = False
+
+# HLS: фоновая упаковка серий через ffmpeg
+HLS_AUTO_PACKAGE = True
+HLS_WORKERS = 2
+HLS_SEGMENT_DURATION = 6
+FFMPEG_BINARY = 'ffmpeg'
+FFPROBE_BINARY = 'ffprobe'
+
+# Превью изображений (Pillow): недостающие строятся в фоне после первого обращения,
+# до этого отдается оригинал
+IMAGE_DERIVATIVES_LAZY = True
+IMAGE_WORKERS = 2
+
+# Комментарии на странице аниме подгружаются порциями
+COMMENTS_PAGE_SIZE = 20
+
+# Импорт списков: файлы меньше этого размера обрабатываются прямо в запросе
+LIST_IMPORT_SYNC_MAX_SIZE = 256 * 1024
+# Файлы больше этого размера не принимаются
+LIST_IMPORT_MAX_SIZE = 10 * 1024 * 1024
+LIST_IMPORT_WORKERS = 1
+LIST_EXPORT_CHUNK_SIZE = 2000
+
+# Учет SQL на каждый запрос: заголовок Server-Timing и выборочный лог в anime.sql.
+# Запросы медленнее SQL_INSTRUMENTATION_SLOW_MS логируются всегда, повторы одной формы
+# запроса от SQL_INSTRUMENTATION_DUPLICATE_THRESHOLD раз помечаются как N+1
+SQL_INSTRUMENTATION_ENABLED = True
+SQL_INSTRUMENTATION_SAMPLE_RATE = 0.01
+SQL_INSTRUMENTATION_SLOW_MS = 500
+SQL_INSTRUMENTATION_DUPLICATE_THRESHOLD = 5
+SQL_INSTRUMENTATION_SLOWEST = 5
+# Server-Timing всем клиентам только при DEBUG, иначе персоналу и INTERNAL_IPS
+SQL_INSTRUMENTATION_SERVER_TIMING = DEBUG
+
+# Чтение с реплик: после записи пользователь читает с основной базы REPLICA_PIN_SECONDS секунд.
+# Реплика проверяется раз в REPLICA_HEALTH_CHECK_INTERVAL секунд и при недоступности или
+# отставании больше REPLICA_MAX_LAG секунд исключается до следующей проверки
+REPLICA_PIN_SECONDS = 5
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+REPLICA_MAX_LAG = 10